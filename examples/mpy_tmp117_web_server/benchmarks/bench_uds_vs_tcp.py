@@ -0,0 +1,116 @@
+##
+# @file bench_uds_vs_tcp.py
+# @brief This Python file compares the latency of requests that a local reverse proxy sends to the
+# Microdot server over a Unix domain socket against the same requests sent over loopback TCP.
+#
+# @details
+# Each server runs in its own process, and the client plays the part of the reverse proxy by opening a
+# new connection for every request, as Microdot closes the connection after each response.
+# Results are printed as JSON.
+#
+# @note This benchmark runs with CPython on Linux or macOS. Run it from the mpy_tmp117_web_server directory:
+#    python3 benchmarks/bench_uds_vs_tcp.py --requests 2000
+#
+# @author SparkFun Electronics
+# @date October 2026
+# @copyright Copyright (c) 2024-2026, SparkFun Electronics Inc.
+#
+# SPDX-License-Identifier: MIT
+# @license MIT
+#
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from microdot import Microdot
+
+kHost = "127.0.0.1"
+kPort = 5081
+kRequest = b"GET /temperature HTTP/1.0\r\nHost: localhost\r\n\r\n"
+
+def serve(**listen_args):
+    """
+    @brief Run a Microdot app with a single small JSON route, like the ones served by the TMP117 server
+    """
+    app = Microdot()
+
+    @app.route('/temperature')
+    async def temperature(request):
+        return {"tempF": 77.1, "tempC": 25.06, "limitH": 77.9, "limitL": 77.0, "alertH": False, "alertL": False}
+
+    app.run(**listen_args)
+
+async def wait_for_server(open_connection):
+    for _ in range(100):
+        try:
+            reader, writer = await open_connection()
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.05)
+    raise RuntimeError("server did not start")
+
+async def measure(open_connection, requests):
+    """
+    @brief Send requests one after the other, each over a new connection, and return the latency of each one
+    """
+    await wait_for_server(open_connection)
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        reader, writer = await open_connection()
+        writer.write(kRequest)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        latencies.append(time.perf_counter() - start)
+        assert response.startswith(b"HTTP/1.0 200")
+    return latencies
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "requests_per_second": round(count / sum(latencies), 1),
+        "mean_us": round(sum(latencies) / count * 1e6, 1),
+        "p50_us": round(latencies[count // 2] * 1e6, 1),
+        "p99_us": round(latencies[min(count - 1, int(count * 0.99))] * 1e6, 1),
+    }
+
+def run_case(listen_args, open_connection, requests):
+    server = multiprocessing.Process(target=serve, kwargs=listen_args, daemon=True)
+    server.start()
+    try:
+        # a short warm up round so that both cases start from the same state
+        asyncio.run(measure(open_connection, min(100, requests)))
+        return summarize(asyncio.run(measure(open_connection, requests)))
+    finally:
+        server.terminate()
+        server.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Microdot request latency over a Unix domain socket and loopback TCP")
+    parser.add_argument("--requests", type=int, default=1000, help="number of requests to send to each server")
+    args = parser.parse_args()
+
+    socket_path = os.path.join(tempfile.mkdtemp(), "microdot.sock")
+    results = {
+        "tcp": run_case({"host": kHost, "port": kPort},
+                        lambda: asyncio.open_connection(kHost, kPort), args.requests),
+        "uds": run_case({"socket_path": socket_path},
+                        lambda: asyncio.open_unix_connection(socket_path), args.requests),
+    }
+    results["uds_speedup"] = round(results["tcp"]["mean_us"] / results["uds"]["mean_us"], 2)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+##
+# @file bench_ws_load.py
+# @brief This Python file load tests the TMP117 web server: it runs the app from tmp117_server_ap.py on localhost
+# with a simulated TMP117, connects a number of websocket clients to the /temperature route, and measures how well
+# the server keeps up over a long soak.
+#
+# @details
+# The server runs in its own process, with the SimulatedTMP117 from tmp117_sensor in place of the qwiic_tmp117 module so that no
+# hardware is needed. There are --sensors simulated TMP117s, at consecutive addresses. Each one finishes a conversion
+# every --sample-ms milliseconds, and each register
+# access can be made to block for --transfer-ms milliseconds, to compare running the sensor calls on the event loop
+# (--inline-sensor) with running them on the server's worker thread. The clients ask
+# for the binary record format, so that the timestamp in each record can be compared with the time it arrives, and
+# they answer the server's pings like a browser would. While the soak runs, the CPU time and memory (RSS) of the
+# server process are sampled from /proc. The availability of the server's event loop is measured in two ways: a
+# task inside the server sleeps for short ticks and records how late it wakes up, and a probe requests a static
+# file over HTTP a few times per second. The report includes:
+# - the message and reading rates, in total and per client,
+# - the latency from the moment a reading was taken by the server to the moment a client decoded it,
+# - the share of time the event loop was free to run other tasks, its longest stall, and the HTTP probe latency,
+# - the CPU used by the server as a percentage of one core, and its memory at the start, end and peak of the soak,
+# - the number of clients that were disconnected before the end.
+# Results are printed as JSON.
+#
+# @note This benchmark runs with CPython on Linux. Run it from the mpy_tmp117_web_server directory:
+#    python3 benchmarks/bench_ws_load.py --clients 20 --duration 600
+#
+# @author SparkFun Electronics
+# @date October 2026
+# @copyright Copyright (c) 2024-2026, SparkFun Electronics Inc.
+#
+# SPDX-License-Identifier: MIT
+# @license MIT
+#
+
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import struct
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from microdot.helpers import ticks_ms, ticks_diff
+from tmp117_sensor import SimulatedTMP117, create_sensor_io
+
+kHost = "127.0.0.1"
+kPort = 5083
+kBinaryProtocol = "tmp117.bin.v1"
+kRecordFormat = "<BBIhhh"
+kRecordSize = struct.calcsize(kRecordFormat)
+kMetricsInterval = 1 # Seconds between samples of the server's CPU time and memory
+kLoopTick = 0.01 # Seconds the event loop monitor in the server sleeps between wake ups
+kProbeInterval = 0.2 # Seconds between HTTP requests of the probe
+kFirstAddress = 0x48 # I2C address of the first simulated TMP117, the next ones count up from there
+kProbeRequest = b"GET /static/index.css HTTP/1.0\r\nHost: localhost\r\n\r\n"
+
+# Conversion cycle and averaging bits that give each conversion period, so the server knows when to expect data
+kConversionBits = {125: (0, 1), 250: (2, 0), 500: (3, 0), 1000: (4, 0), 4000: (5, 0), 8000: (6, 0), 16000: (7, 0)}
+
+async def monitor_loop(loopStats):
+    """
+    @brief Sleep for kLoopTick over and over, adding the time asked for and the time actually slept to loopStats, and
+    keeping the longest stall. Any time a task runs without yielding to the event loop makes the wake up late
+    """
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(kLoopTick)
+        slept = time.monotonic() - start
+        loopStats[0] += kLoopTick
+        loopStats[1] += slept
+        loopStats[2] = max(loopStats[2], slept - kLoopTick)
+
+def serve(sampleMs, alerts, transferMs, threaded, sensorCount, loopStats):
+    """
+    @brief Run the app from tmp117_server_ap.py with sensorCount simulated TMP117s, and the event loop monitor
+    """
+    sys.stdout = open(os.devnull, "w") # Keep the server's messages out of the JSON report
+
+    def create_sensor(address=None):
+        sensor = SimulatedTMP117(address, transferMs=transferMs)
+        sensor.set_conversion_cycle_bit(kConversionBits[sampleMs][0])
+        sensor.set_conversion_average_mode(kConversionBits[sampleMs][1])
+        return sensor
+
+    # Stand in for the qwiic_tmp117 library, so the app is imported exactly as it runs on the board
+    sensorModule = types.ModuleType("qwiic_tmp117")
+    sensorModule.QwiicTMP117 = create_sensor
+    sys.modules["qwiic_tmp117"] = sensorModule
+
+    import tmp117_server_ap as server
+
+    server.kDoAlerts = alerts
+    server.sensorIO = create_sensor_io(threaded)
+    # Every client connects from 127.0.0.1, so the per-client rate limit would reject all but the first few
+    server.rateLimiter.rate = server.rateLimiter.burst = 1000000
+    # Replace the sensors in place, since the routes use the same list
+    server.sensors[:] = [server.MonitoredSensor(sensorId, kFirstAddress + sensorId, create_sensor(kFirstAddress + sensorId))
+                         for sensorId in range(sensorCount)]
+    for sensor in server.sensors:
+        server.config_TMP117(sensor.device, alerts)
+
+    async def main():
+        asyncio.create_task(monitor_loop(loopStats))
+        await server.serve(host=kHost, port=kPort)
+
+    asyncio.run(main())
+
+def mask_frame(opcode, payload):
+    mask = os.urandom(4)
+    return bytes([0x80 | opcode, 0x80 | len(payload)]) + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+class ClientStats:
+    """
+    @brief The measurements collected by all the clients
+    """
+    def __init__(self):
+        self.messages = 0
+        self.readings = 0
+        self.latencies = []
+        self.connected = 0
+        self.disconnected = 0
+        self.recording = False
+
+async def client(stats, stop):
+    """
+    @brief A websocket client that reads binary records from the /temperature route until stop is set
+    """
+    reader, writer = await asyncio.open_connection(kHost, kPort)
+    key = base64.b64encode(os.urandom(16))
+    writer.write(b"GET /temperature HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                 b"Sec-WebSocket-Key: " + key + b"\r\nSec-WebSocket-Version: 13\r\n"
+                 b"Sec-WebSocket-Protocol: " + kBinaryProtocol.encode() + b"\r\n\r\n")
+    await writer.drain()
+    response = await reader.readuntil(b"\r\n\r\n")
+    if not response.startswith(b"HTTP/1.1 101"):
+        raise RuntimeError("websocket upgrade failed: " + response.split(b"\r\n")[0].decode())
+    stats.connected += 1
+    try:
+        while not stop.is_set():
+            header = await reader.readexactly(2)
+            length = header[1] & 0x7f
+            if length == 126:
+                length = int.from_bytes(await reader.readexactly(2), "big")
+            elif length == 127:
+                length = int.from_bytes(await reader.readexactly(8), "big")
+            payload = await reader.readexactly(length)
+            opcode = header[0] & 0x0f
+            if opcode == 9:
+                writer.write(mask_frame(10, payload))
+                await writer.drain()
+                continue
+            if opcode == 8:
+                break
+            now = ticks_ms() # The server's ticks_ms() uses the same clock on CPython
+            if not stats.recording:
+                continue
+            stats.messages += 1
+            for offset in range(0, len(payload) - kRecordSize + 1, kRecordSize):
+                timestamp = struct.unpack_from(kRecordFormat, payload, offset)[2]
+                stats.readings += 1
+                stats.latencies.append(ticks_diff(now, timestamp))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        if not stop.is_set():
+            stats.disconnected += 1
+        writer.close()
+
+async def probe(latencies, stop):
+    """
+    @brief Request a static file from the server every kProbeInterval seconds until stop is set, and record how long
+    each response takes
+    """
+    while not stop.is_set():
+        start = time.monotonic()
+        reader, writer = await asyncio.open_connection(kHost, kPort)
+        writer.write(kProbeRequest)
+        await writer.drain()
+        await reader.read()
+        writer.close()
+        latencies.append((time.monotonic() - start) * 1000)
+        await asyncio.sleep(kProbeInterval)
+
+def read_process(pid):
+    """
+    @brief Return the CPU seconds used so far and the resident memory in KB of a process
+    """
+    with open("/proc/{}/stat".format(pid)) as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    with open("/proc/{}/status".format(pid)) as f:
+        rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+    return cpu, rss
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else None
+
+async def run(pid, loopStats, clients, duration, warmup):
+    for _ in range(100):
+        try:
+            reader, writer = await asyncio.open_connection(kHost, kPort)
+            writer.close()
+            break
+        except OSError:
+            await asyncio.sleep(0.05)
+    else:
+        raise RuntimeError("server did not start")
+
+    stats = ClientStats()
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(client(stats, stop)) for _ in range(clients)]
+    await asyncio.sleep(warmup)
+
+    stats.recording = True
+    loopStats[:] = [0, 0, 0]
+    probeLatencies = []
+    probeTask = asyncio.create_task(probe(probeLatencies, stop))
+    startCpu, startRss = read_process(pid)
+    peakRss = startRss
+    start = time.monotonic()
+    while time.monotonic() - start < duration:
+        await asyncio.sleep(kMetricsInterval)
+        peakRss = max(peakRss, read_process(pid)[1])
+    elapsed = time.monotonic() - start
+    endCpu, endRss = read_process(pid)
+    stats.recording = False
+    loopAsked, loopSlept, loopMaxStall = loopStats[:]
+
+    stop.set()
+    await probeTask
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies = sorted(stats.latencies)
+    return {
+        "clients": clients,
+        "connected": stats.connected,
+        "disconnected": stats.disconnected,
+        "duration_s": round(elapsed, 1),
+        "messages_per_second": round(stats.messages / elapsed, 2),
+        "messages_per_second_per_client": round(stats.messages / elapsed / max(1, stats.connected), 3),
+        "readings_per_second": round(stats.readings / elapsed, 2),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 1) if latencies else None,
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else None,
+        },
+        "event_loop": {
+            "available_percent": round(loopAsked / loopSlept * 100, 1) if loopSlept else None,
+            "max_stall_ms": round(loopMaxStall * 1000, 1),
+            "http_probe_ms": {
+                "p50": round(percentile(probeLatencies, 0.5), 1) if probeLatencies else None,
+                "max": round(max(probeLatencies), 1) if probeLatencies else None,
+            },
+        },
+        "server_cpu_percent": round((endCpu - startCpu) / elapsed * 100, 1),
+        "server_rss_kb": {"start": startRss, "end": endRss, "peak": peakRss},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the TMP117 web server with many websocket clients")
+    parser.add_argument("--clients", type=int, default=10, help="number of concurrent websocket clients")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to measure for, after the warm up")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds to let the clients connect before measuring")
+    parser.add_argument("--sample-ms", type=int, default=125, choices=sorted(kConversionBits),
+                        help="conversion period of the simulated TMP117")
+    parser.add_argument("--no-alerts", action="store_true", help="run the server with kDoAlerts set to False")
+    parser.add_argument("--transfer-ms", type=float, default=0, help="milliseconds each access to the simulated TMP117 blocks for")
+    parser.add_argument("--sensors", type=int, default=1, choices=range(1, 5), help="number of simulated TMP117s")
+    parser.add_argument("--inline-sensor", action="store_true", help="call the sensor on the event loop instead of a worker thread")
+    args = parser.parse_args()
+
+    loopStats = multiprocessing.Array("d", 3, lock=False) # Seconds asked to sleep, seconds slept, longest stall
+    server = multiprocessing.Process(target=serve, daemon=True, args=(args.sample_ms, not args.no_alerts, args.transfer_ms,
+                                                                      not args.inline_sensor, args.sensors, loopStats))
+    server.start()
+    try:
+        results = asyncio.run(run(server.pid, loopStats, args.clients, args.duration, args.warmup))
+    finally:
+        server.terminate()
+        server.join()
+    results["sample_ms"] = args.sample_ms
+    results["alerts"] = not args.no_alerts
+    results["transfer_ms"] = args.transfer_ms
+    results["sensor_thread"] = not args.inline_sensor
+    results["sensors"] = args.sensors
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
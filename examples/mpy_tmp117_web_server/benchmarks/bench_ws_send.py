@@ -0,0 +1,165 @@
+##
+# @file bench_ws_send.py
+# @brief This Python file measures the cost of sending websocket messages of different sizes from the Microdot
+# server, comparing frames built by concatenating the header and the payload with the buffered write path.
+#
+# @details
+# The server runs in its own process. For each case the client asks the server to send a number of messages of
+# one size and reads them all. Both modes send with WebSocket.send(). In the "concatenated" mode every message is
+# encoded into a new frame with WebSocket._encode_websocket_frame(), as the server did before, and in the "buffered"
+# mode small frames are assembled in a reused buffer and large ones are written as a header and a payload without
+# copying.
+# For each mode the server reports the CPU time it spent per message, the throughput seen by the client, and the
+# peak memory allocated while sending a message (measured separately with tracemalloc). Results are printed as JSON.
+#
+# @note This benchmark runs with CPython on Linux or macOS. Run it from the mpy_tmp117_web_server directory:
+#    python3 benchmarks/bench_ws_send.py --messages 20000
+#
+# @author SparkFun Electronics
+# @date October 2026
+# @copyright Copyright (c) 2024-2026, SparkFun Electronics Inc.
+#
+# SPDX-License-Identifier: MIT
+# @license MIT
+#
+
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from microdot import Microdot
+from microdot.websocket import WebSocket, with_websocket
+
+kHost = "127.0.0.1"
+kPort = 5082
+kSizes = [100, 1024, 16384, 65536]
+kModes = ["concatenated", "buffered"]
+kAllocMessages = 20 # Messages sent with tracemalloc enabled to find the peak allocation of each mode
+
+class ConcatenatingWebSocket(WebSocket):
+    """
+    @brief A websocket that writes every frame the way the server did before frames were written in parts
+    """
+    async def _write_parts(self, opcode, payload, fin=True, compressed=False):
+        await self.request.sock[1].awrite(self._encode_websocket_frame(opcode, payload, fin=fin, compressed=compressed))
+
+def serve():
+    """
+    @brief Run a Microdot app with a websocket route that sends the messages requested by the client
+    """
+    app = Microdot()
+
+    async def send_messages(ws, mode, payload, count):
+        ws.__class__ = ConcatenatingWebSocket if mode == "concatenated" else WebSocket
+        for _ in range(count):
+            await ws.send(payload, WebSocket.BINARY)
+
+    @app.route('/send')
+    @with_websocket
+    async def send(request, ws):
+        while True:
+            mode, size, count, trace = (await ws.receive()).split()
+            payload = memoryview(bytearray(b"x" * int(size)))
+            count = int(count)
+            peak = 0
+            if trace == "1":
+                tracemalloc.start()
+                base = tracemalloc.get_traced_memory()[0]
+                await send_messages(ws, mode, payload, count)
+                peak = tracemalloc.get_traced_memory()[1] - base
+                tracemalloc.stop()
+            else:
+                start = time.process_time()
+                await send_messages(ws, mode, payload, count)
+                cpu = time.process_time() - start
+            await ws.send(json.dumps({"cpu": cpu if trace != "1" else 0, "peak": peak}))
+
+    app.run(host=kHost, port=kPort)
+
+def mask_text(text):
+    mask = os.urandom(4)
+    data = text.encode()
+    return bytes([0x81, 0x80 | len(data)]) + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+
+def frame_length(size):
+    return size + (2 if size < 126 else 4 if size < 65536 else 10)
+
+async def connect():
+    for _ in range(100):
+        try:
+            reader, writer = await asyncio.open_connection(kHost, kPort)
+            break
+        except OSError:
+            await asyncio.sleep(0.05)
+    else:
+        raise RuntimeError("server did not start")
+    key = base64.b64encode(os.urandom(16))
+    writer.write(b"GET /send HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                 b"Sec-WebSocket-Key: " + key + b"\r\nSec-WebSocket-Version: 13\r\n\r\n")
+    await writer.drain()
+    await reader.readuntil(b"\r\n\r\n")
+    return reader, writer
+
+async def measure(reader, writer, mode, size, count, trace=False):
+    """
+    @brief Ask the server for count messages of the given size, and return the seconds it took to receive them
+    along with the server's report
+    """
+    start = time.perf_counter()
+    writer.write(mask_text("{} {} {} {}".format(mode, size, count, 1 if trace else 0)))
+    await writer.drain()
+    remaining = count * frame_length(size)
+    while remaining:
+        remaining -= len(await reader.read(min(remaining, 1 << 18)))
+    elapsed = time.perf_counter() - start
+    header = await reader.readexactly(2)
+    report = json.loads(await reader.readexactly(header[1]))
+    return elapsed, report
+
+async def run(messages):
+    reader, writer = await connect()
+    results = {}
+    for size in kSizes:
+        count = max(100, messages * 1024 // max(size, 1024))
+        case = {"messages": count}
+        for mode in kModes:
+            await measure(reader, writer, mode, size, min(count, 100))  # warm up
+            runs = [await measure(reader, writer, mode, size, count) for _ in range(3)]
+            elapsed = min(run[0] for run in runs)
+            cpu = min(run[1]["cpu"] for run in runs)
+            _, report = await measure(reader, writer, mode, size, kAllocMessages, trace=True)
+            case[mode] = {
+                "server_cpu_us_per_message": round(cpu / count * 1e6, 2),
+                "mb_per_second": round(count * size / elapsed / 1e6, 2),
+                "peak_alloc_bytes": report["peak"],
+            }
+        case["cpu_speedup"] = round(case["concatenated"]["server_cpu_us_per_message"] /
+                                    case["buffered"]["server_cpu_us_per_message"], 2)
+        results[str(size)] = case
+    writer.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the cost of sending concatenated and buffered websocket frames")
+    parser.add_argument("--messages", type=int, default=20000, help="number of small messages sent in each case")
+    args = parser.parse_args()
+
+    server = multiprocessing.Process(target=serve, daemon=True)
+    server.start()
+    try:
+        results = {"python": sys.version.split()[0], "sizes": asyncio.run(run(args.messages))}
+    finally:
+        server.terminate()
+        server.join()
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+##
+# @file bench_ws_unmask.py
+# @brief This Python file measures how long it takes to unmask the payload of a client websocket frame
+# with each of the unmasking routines in microdot.websocket, across a range of payload sizes.
+#
+# @details
+# The original per-byte generator is included as a reference. The NumPy routine is only measured when
+# NumPy is installed. Results are printed as JSON, in microseconds per call.
+#
+# @note This benchmark runs with CPython or MicroPython. Run it from the mpy_tmp117_web_server directory:
+#    python3 benchmarks/bench_ws_unmask.py
+#
+# @author SparkFun Electronics
+# @date October 2026
+# @copyright Copyright (c) 2024-2026, SparkFun Electronics Inc.
+#
+# SPDX-License-Identifier: MIT
+# @license MIT
+#
+
+import json
+import sys
+
+# Import microdot from the mpy_tmp117_web_server directory
+sys.path.insert(0, '.')
+
+from microdot import websocket
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(ticks1, ticks2):
+        return ticks1 - ticks2
+
+kSizes = [16, 125, 1024, 4096, 16384, 65536]
+kMask = b'\x3a\x91\xc4\x07'
+
+def unmask_generator(payload, mask):
+    # the original implementation, one byte at a time
+    return bytes(x ^ mask[i % 4] for i, x in enumerate(payload))
+
+def unmask_bytearray(payload, mask):
+    return bytes(websocket._unmask_inplace(bytearray(payload), mask))
+
+def time_call(func, payload, budget_us=200000):
+    """
+    @brief Return the average time of a call to func in microseconds, repeating it for about budget_us
+    """
+    calls = 0
+    start = ticks_us()
+    while True:
+        func(payload, kMask)
+        calls += 1
+        elapsed = ticks_diff(ticks_us(), start)
+        if elapsed >= budget_us:
+            return round(elapsed / calls, 2)
+
+def main():
+    routines = {
+        "generator": unmask_generator,
+        "bytearray_inplace": unmask_bytearray,
+        "unmask": websocket._unmask,
+    }
+    if not websocket._micropython:
+        routines["int_xor"] = websocket._unmask_int
+        try:
+            import numpy
+            websocket._numpy = numpy
+            routines["numpy"] = websocket._unmask_numpy
+        except ImportError:
+            pass
+
+    results = {"implementation": sys.implementation.name, "us_per_call": {}}
+    for size in kSizes:
+        payload = bytes(i & 0xff for i in range(size))
+        expected = unmask_generator(payload, kMask)
+        timings = {}
+        for name, func in routines.items():
+            assert func(payload, kMask) == expected, name
+            timings[name] = time_call(func, payload)
+        results["us_per_call"][str(size)] = timings
+    print(json.dumps(results))
+
+main()
@@ -0,0 +1,206 @@
+import asyncio
+import sys
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # pragma: no cover
+    # MicroPython does not have threads that work with asyncio
+    ThreadPoolExecutor = None
+
+
+class AccessLog:
+    """Log every request handled by the server without blocking it.
+
+    :param app: The application to log. If not given, the :meth:`initialize`
+                method must be called later.
+    :param stream: The stream where the log is written. This can be a regular
+                   file-like object with a ``write()`` method, or an
+                   asynchronous stream with an ``awrite()`` method. The
+                   default is ``sys.stdout``.
+    :param filename: The name of a file to append the log to. When given,
+                     ``stream`` is ignored.
+    :param capacity: The number of records that can be waiting to be written.
+                     When the buffer is full, new records are dropped.
+    :param flush_interval: The number of seconds to wait between writes.
+    :param batch_size: The maximum number of records written at a time.
+
+    Each record includes the client address, the method and path of the
+    request, the status code and the number of body bytes of the response,
+    and the time it took to handle the request in milliseconds::
+
+        192.168.4.16 GET /static/index.css 200 3593 4ms
+
+    Records are formatted into a fixed size ring buffer when each response is
+    sent, and a background task writes them in batches. If the log cannot be
+    written as fast as requests arrive, records are dropped and counted
+    instead of slowing down the server.
+
+    Streams with a blocking ``write()`` are kept off the event loop where the
+    platform allows it: on CPython they are written from a worker thread, and
+    on MicroPython ``sys.stdout`` is wrapped in an ``asyncio.StreamWriter``.
+    Any other blocking stream is written one record per turn of the event
+    loop, so a slow stream blocks the server for one record at a time while
+    the buffer fills up and drops the records that do not fit.
+
+    Example::
+
+        from microdot import Microdot
+        from microdot.accesslog import AccessLog
+
+        app = Microdot()
+        AccessLog(app, filename='access.log')
+    """
+    #: The format of each log record. The available fields are ``client``,
+    #: ``method``, ``path``, ``status``, ``bytes`` and ``latency``.
+    record_format = '{client} {method} {path} {status} {bytes} {latency}ms\n'
+
+    def __init__(self, app=None, stream=None, filename=None, capacity=32,
+                 flush_interval=1, batch_size=16):
+        self.stream = stream
+        self.filename = filename
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.records = [None] * capacity
+        self.head = 0
+        self.count = 0
+        #: The number of records that were dropped because the buffer was
+        #: full.
+        self.dropped = 0
+        self.task = None
+        # created by the writer task, so that it belongs to the running loop
+        self.wakeup = None
+        if app:
+            self.initialize(app)
+
+    def initialize(self, app):
+        """Start logging the requests of the given application.
+
+        :param app: The application to log.
+        """
+        app.access_log = self
+
+    def format_record(self, request, response, latency_ms):
+        """Return the log line for a request.
+
+        :param request: The request object.
+        :param response: The response object.
+        :param latency_ms: The time it took to handle the request, in
+                           milliseconds.
+
+        Subclasses can override this method to change the log format.
+        """
+        addr = request.client_addr
+        if isinstance(addr, (tuple, list)):
+            addr = addr[0]
+        return self.record_format.format(
+            client=addr or '-', method=request.method, path=request.path,
+            status=response.status_code, bytes=response.bytes_sent,
+            latency=latency_ms)
+
+    def log(self, request, response, latency_ms):
+        """Add a request to the log. This method never blocks.
+
+        :param request: The request object.
+        :param response: The response object.
+        :param latency_ms: The time it took to handle the request, in
+                           milliseconds.
+        """
+        if self.count == self.capacity:
+            self.dropped += 1
+            return
+        self.records[(self.head + self.count) % self.capacity] = \
+            self.format_record(request, response, latency_ms)
+        self.count += 1
+        if self.task is None:
+            self.task = asyncio.create_task(self.writer())
+        if self.count >= self.batch_size and self.wakeup:
+            self.wakeup.set()
+
+    def take_batch(self, n=None):
+        """Remove the oldest records from the buffer and return them as a
+        single string.
+
+        :param n: The maximum number of records to remove. The default is
+                  ``batch_size``.
+        """
+        n = min(self.count, n or self.batch_size)
+        batch = []
+        for _ in range(n):
+            batch.append(self.records[self.head])
+            self.records[self.head] = None
+            self.head = (self.head + 1) % self.capacity
+        self.count -= n
+        return ''.join(batch)
+
+    async def writer(self):
+        try:
+            await self._write_records()
+        finally:
+            # the next record starts a new writer task
+            self.task = None
+
+    async def _write_records(self):
+        self.wakeup = asyncio.Event()
+        stream = self.stream or sys.stdout
+        if self.filename:
+            stream = open(self.filename, 'a')
+        sink = _AsyncSink(stream)
+        try:
+            while True:
+                if self.count < self.batch_size:
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(),
+                                               self.flush_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                self.wakeup.clear()
+                while self.count:
+                    await sink.awrite(self.take_batch(sink.batch_size))
+                    # give the server a chance to run between batches
+                    await asyncio.sleep(0)
+        finally:
+            sink.close()
+            if self.filename:
+                stream.close()
+
+
+class _AsyncSink:
+    # writes log batches to a stream without blocking the event loop, in the
+    # best way the platform allows
+    def __init__(self, stream):
+        self.stream = stream
+        self.executor = None
+        self.batch_size = None  # whole batches
+        if hasattr(stream, 'awrite'):
+            self.writer = stream
+        elif ThreadPoolExecutor is not None:
+            self.writer = None
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        elif stream is sys.stdout and hasattr(asyncio, 'StreamWriter'):
+            # MicroPython streams can be polled, so the writes wait for the
+            # console to be ready instead of blocking the event loop
+            self.writer = asyncio.StreamWriter(stream, {})
+        else:
+            # no way to wait for the stream, so block for one record at a
+            # time and let the buffer drop what does not fit
+            self.writer = None
+            self.batch_size = 1
+
+    def write(self, data):
+        self.stream.write(data)
+        if hasattr(self.stream, 'flush'):
+            self.stream.flush()
+
+    async def awrite(self, data):
+        if self.writer is not None:
+            await self.writer.awrite(data)
+        elif self.executor is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.write, data)
+        else:
+            self.write(data)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
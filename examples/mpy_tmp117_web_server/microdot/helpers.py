@@ -6,3 +6,25 @@ except ImportError:  # pragma: no cover
         def _(wrapper):
             return wrapper
         return _
+
+try:
+    from time import ticks_ms, ticks_diff, ticks_add
+except ImportError:  # pragma: no cover
+    # CPython does not have the MicroPython ticks functions, so they are
+    # emulated with a monotonic clock that wraps around like they do, so that
+    # timestamps stored in fixed size fields behave the same on both
+    from time import monotonic
+
+    _TICKS_PERIOD = 1 << 30
+    _TICKS_MAX = _TICKS_PERIOD - 1
+    _TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+
+    def ticks_ms():
+        return int(monotonic() * 1000) & _TICKS_MAX
+
+    def ticks_diff(ticks1, ticks2):
+        return ((ticks1 - ticks2 + _TICKS_HALFPERIOD) & _TICKS_MAX) - \
+            _TICKS_HALFPERIOD
+
+    def ticks_add(ticks, delta):
+        return (ticks + delta) & _TICKS_MAX
@@ -10,6 +10,8 @@ import io
 import json
 import time
 
+from microdot.helpers import ticks_ms, ticks_diff
+
 try:
     from inspect import iscoroutinefunction, iscoroutine
     from functools import partial
@@ -270,6 +272,77 @@ class MultiDict(dict):
         return values
 
 
+class TimerWheel:
+    """A hashed timing wheel that invokes callbacks after a timeout.
+
+    :param resolution: The number of seconds between ticks of the wheel.
+                       Timers fire up to this much later than requested.
+    :param size: The number of slots in the wheel.
+
+    All the timers share a single background task that wakes up once per
+    tick, instead of each timeout requiring its own task. Adding or
+    cancelling a timer does not involve the event loop, which makes it cheap
+    enough to arm a timer around every read of a connection.
+    """
+    def __init__(self, resolution=0.5, size=16):
+        self.resolution = resolution
+        self.slots = [[] for _ in range(size)]
+        self.position = 0
+        self.pending = 0
+        self.task = None
+
+    def add(self, timeout, callback):
+        """Invoke a callback after the given number of seconds. The return
+        value can be passed to :meth:`cancel`.
+
+        :param timeout: The timeout in seconds.
+        :param callback: A function that takes no arguments.
+        """
+        ticks = max(1, int(timeout / self.resolution + 0.999))
+        size = len(self.slots)
+        timer = [(ticks - 1) // size, callback]
+        self.slots[(self.position + ticks) % size].append(timer)
+        self.pending += 1
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+        return timer
+
+    @staticmethod
+    def cancel(timer):
+        """Cancel a timer.
+
+        :param timer: The timer to cancel, as returned by :meth:`add`.
+        """
+        # cancelled timers are removed when the wheel reaches their slot
+        timer[1] = None
+
+    async def _run(self):
+        while self.pending:
+            await asyncio.sleep(self.resolution)
+            self.position = (self.position + 1) % len(self.slots)
+            slot = self.slots[self.position]
+            if not slot:
+                continue
+            self.slots[self.position] = waiting = []
+            for timer in slot:
+                if timer[1] is not None and timer[0] > 0:
+                    timer[0] -= 1
+                    waiting.append(timer)
+                    continue
+                self.pending -= 1
+                if timer[1] is not None:
+                    try:
+                        timer[1]()
+                    except Exception as exc:  # pragma: no cover
+                        print_exception(exc)
+        self.task = None
+
+
+class RequestTimeout(Exception):
+    """Exception raised when a client takes too long to send its request."""
+    pass
+
+
 class AsyncBytesIO:
     """An async wrapper for BytesIO."""
     def __init__(self, data):
@@ -325,6 +398,25 @@ class Request:
     #:    Request.max_readline = 16 * 1024  # 16KB lines allowed
     max_readline = 2 * 1024
 
+    #: Specify the maximum number of seconds to wait for a client to send the
+    #: first line of its request after connecting. Clients that stay idle
+    #: longer are disconnected. Set to ``None`` to wait forever.
+    #:
+    #: Example::
+    #:
+    #:    Request.idle_timeout = 5
+    idle_timeout = None
+
+    #: Specify the maximum number of seconds a client can take to send the
+    #: request headers, after the first line was received. Set to ``None`` to
+    #: wait forever.
+    header_timeout = None
+
+    #: Specify the maximum number of seconds a client can take to send the
+    #: request body, when it is small enough to be stored in ``body``. Set to
+    #: ``None`` to wait forever.
+    body_timeout = None
+
     class G:
         pass
 
@@ -398,37 +490,54 @@ class Request:
         :param client_addr: The address of the client, as a tuple.
 
         This method is a coroutine. It returns a newly created ``Request``
-        object.
+        object. If the client does not send its request within the configured
+        timeouts, the read is interrupted and ``RequestTimeout`` is raised.
         """
-        # request line
-        line = (await Request._safe_readline(client_reader)).strip().decode()
-        if not line:  # pragma: no cover
-            return None
-        method, url, http_version = line.split()
-        http_version = http_version.split('/', 1)[1]
-
-        # headers
-        headers = NoCaseDict()
-        content_length = 0
-        while True:
+        deadline = _ReadDeadline(app)
+        try:
+            # request line
+            deadline.start('idle', Request.idle_timeout)
             line = (await Request._safe_readline(
                 client_reader)).strip().decode()
-            if line == '':
-                break
-            header, value = line.split(':', 1)
-            value = value.strip()
-            headers[header] = value
-            if header.lower() == 'content-length':
-                content_length = int(value)
-
-        # body
-        body = b''
-        if content_length and content_length <= Request.max_body_length:
-            body = await client_reader.readexactly(content_length)
-            stream = None
-        else:
+            if not line:  # pragma: no cover
+                deadline.check()
+                return None
+            method, url, http_version = line.split()
+            http_version = http_version.split('/', 1)[1]
+
+            # headers
+            deadline.start('header', Request.header_timeout)
+            headers = NoCaseDict()
+            content_length = 0
+            while True:
+                line = (await Request._safe_readline(
+                    client_reader)).strip().decode()
+                if line == '':
+                    break
+                header, value = line.split(':', 1)
+                value = value.strip()
+                headers[header] = value
+                if header.lower() == 'content-length':
+                    content_length = int(value)
+
+            # body
             body = b''
-            stream = client_reader
+            if content_length and content_length <= Request.max_body_length:
+                deadline.start('body', Request.body_timeout)
+                body = await client_reader.readexactly(content_length)
+                stream = None
+            else:
+                body = b''
+                stream = client_reader
+            deadline.check()
+        except asyncio.CancelledError:
+            # a read that was interrupted by a timeout is reported as such
+            if not deadline.expired:
+                raise
+            deadline.uncancel()
+            raise RequestTimeout(deadline.phase)
+        finally:
+            deadline.stop()
 
         return Request(app, client_addr, method, url, http_version, headers,
                        body=body, stream=stream,
@@ -521,6 +630,47 @@ class Request:
         return line
 
 
+class _ReadDeadline:
+    # interrupts the read of a request when its current phase takes longer
+    # than its timeout, using the application's shared timer wheel
+    def __init__(self, app):
+        self.app = app
+        self.phase = None
+        self.timer = None
+        self.task = None
+        self.expired = False
+
+    def start(self, phase, timeout):
+        self.stop()
+        if timeout and self.app:
+            self.phase = phase
+            self.task = asyncio.current_task()
+            self.timer = self.app.timer_wheel.add(timeout, self.expire)
+
+    def stop(self):
+        if self.timer is not None:
+            TimerWheel.cancel(self.timer)
+            self.timer = None
+
+    def check(self):
+        if self.expired:
+            raise RequestTimeout(self.phase)
+
+    def expire(self):
+        # closing the stream does not wake up a pending read on MicroPython,
+        # so the task that is reading is cancelled instead
+        self.timer = None
+        self.expired = True
+        self.app.timeouts[self.phase] += 1
+        self.task.cancel()
+
+    def uncancel(self):
+        # the cancellation was turned into a timeout, so it is not pending
+        # anymore (only tracked by CPython 3.11 and newer)
+        if hasattr(self.task, 'uncancel'):
+            self.task.uncancel()
+
+
 class Response:
     """An HTTP response class.
 
@@ -577,6 +727,8 @@ class Response:
             # this applies to bytes, file-like objects or generators
             self.body = body
         self.is_head = False
+        #: The number of body bytes written to the client.
+        self.bytes_sent = 0
 
     def set_cookie(self, cookie, value, path=None, domain=None, expires=None,
                    max_age=None, secure=False, http_only=False,
@@ -663,6 +815,7 @@ class Response:
                         body = body.encode()
                     try:
                         await stream.awrite(body)
+                        self.bytes_sent += len(body)
                     except OSError as exc:  # pragma: no cover
                         if exc.errno in MUTED_SOCKET_ERRORS or \
                                 exc.args[0] == 'Connection lost':
@@ -935,6 +1088,16 @@ class Microdot:
         self.options_handler = self.default_options_handler
         self.debug = False
         self.server = None
+        #: An object with a ``log(request, response, latency_ms)`` method that
+        #: is called after each response is written, such as an
+        #: :class:`AccessLog <microdot.accesslog.AccessLog>` instance.
+        self.access_log = None
+        #: The timer wheel used to enforce the request read timeouts.
+        self.timer_wheel = TimerWheel()
+        #: The number of connections that were closed by each of the request
+        #: timeouts. See :attr:`Request.idle_timeout`,
+        #: :attr:`Request.header_timeout` and :attr:`Request.body_timeout`.
+        self.timeouts = {'idle': 0, 'header': 0, 'body': 0}
 
     def route(self, url_pattern, methods=None):
         """Decorator that is used to register a function as a request handler
@@ -1188,7 +1351,7 @@ class Microdot:
         raise HTTPException(status_code, reason)
 
     async def start_server(self, host='0.0.0.0', port=5000, debug=False,
-                           ssl=None):
+                           ssl=None, sock=None, socket_path=None):
         """Start the Microdot web server as a coroutine. This coroutine does
         not normally return, as the server enters an endless listening loop.
         The :func:`shutdown` function provides a method for terminating the
@@ -1207,6 +1370,15 @@ class Microdot:
                       default is ``False``.
         :param ssl: An ``SSLContext`` instance or ``None`` if the server should
                     not use TLS. The default is ``None``.
+        :param sock: An already bound listening socket to accept connections
+                     from, for example one passed by systemd's socket
+                     activation. When given, ``host`` and ``port`` are
+                     ignored. Only supported on CPython.
+        :param socket_path: The path of a Unix domain socket to listen on,
+                            for example to receive requests from a reverse
+                            proxy running on the same host. When given,
+                            ``host`` and ``port`` are ignored. Only supported
+                            on CPython running on Unix.
 
         This method is a coroutine.
 
@@ -1246,14 +1418,29 @@ class Microdot:
             await self.handle_request(reader, writer)
 
         if self.debug:  # pragma: no cover
-            print('Starting async server on {host}:{port}...'.format(
-                host=host, port=port))
+            if sock is not None:
+                print('Starting async server on {address}...'.format(
+                    address=sock.getsockname()))
+            elif socket_path is not None:
+                print('Starting async server on {path}...'.format(
+                    path=socket_path))
+            else:
+                print('Starting async server on {host}:{port}...'.format(
+                    host=host, port=port))
 
-        try:
-            self.server = await asyncio.start_server(serve, host, port,
+        if sock is not None:
+            self.server = await asyncio.start_server(serve, sock=sock,
                                                      ssl=ssl)
-        except TypeError:  # pragma: no cover
-            self.server = await asyncio.start_server(serve, host, port)
+        elif socket_path is not None:
+            self._remove_stale_socket(socket_path)
+            self.server = await asyncio.start_unix_server(serve, socket_path,
+                                                          ssl=ssl)
+        else:
+            try:
+                self.server = await asyncio.start_server(serve, host, port,
+                                                         ssl=ssl)
+            except TypeError:  # pragma: no cover
+                self.server = await asyncio.start_server(serve, host, port)
 
         while True:
             try:
@@ -1269,7 +1456,8 @@ class Microdot:
                 # wait a bit and try again
                 await asyncio.sleep(0.1)
 
-    def run(self, host='0.0.0.0', port=5000, debug=False, ssl=None):
+    def run(self, host='0.0.0.0', port=5000, debug=False, ssl=None,
+            sock=None, socket_path=None):
         """Start the web server. This function does not normally return, as
         the server enters an endless listening loop. The :func:`shutdown`
         function provides a method for terminating the server gracefully.
@@ -1287,6 +1475,12 @@ class Microdot:
                       default is ``False``.
         :param ssl: An ``SSLContext`` instance or ``None`` if the server should
                     not use TLS. The default is ``None``.
+        :param sock: An already bound listening socket to accept connections
+                     from. When given, ``host`` and ``port`` are ignored.
+                     Only supported on CPython.
+        :param socket_path: The path of a Unix domain socket to listen on.
+                            When given, ``host`` and ``port`` are ignored.
+                            Only supported on CPython running on Unix.
 
         Example::
 
@@ -1299,9 +1493,31 @@ class Microdot:
                 return 'Hello, world!'
 
             app.run(debug=True)
+
+        To run behind a reverse proxy on the same host, listen on a Unix
+        domain socket, or accept connections from a socket that was bound by
+        the service manager::
+
+            app.run(socket_path='/run/microdot.sock')
+
+            import socket
+            app.run(sock=socket.socket(fileno=3))  # systemd socket activation
         """
-        asyncio.run(self.start_server(host=host, port=port, debug=debug,
-                                      ssl=ssl))  # pragma: no cover
+        asyncio.run(self.start_server(  # pragma: no cover
+            host=host, port=port, debug=debug, ssl=ssl, sock=sock,
+            socket_path=socket_path))
+
+    @staticmethod
+    def _remove_stale_socket(socket_path):
+        # a socket file left behind by a previous run prevents binding again,
+        # but anything that is not a socket is left alone
+        import os
+        import stat
+        try:
+            if stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                os.remove(socket_path)
+        except OSError:
+            pass
 
     def shutdown(self):
         """Request a server shutdown. The server will then exit its request
@@ -1355,9 +1571,17 @@ class Microdot:
         try:
             req = await Request.create(self, reader, writer,
                                        writer.get_extra_info('peername'))
+        except RequestTimeout:
+            # free the socket of the client that was too slow
+            try:
+                await writer.aclose()
+            except OSError:  # pragma: no cover
+                pass
+            return
         except Exception as exc:  # pragma: no cover
             print_exception(exc)
 
+        start = ticks_ms()
         res = await self.dispatch_request(req)
         if res != Response.already_handled:  # pragma: no branch
             await res.write(writer)
@@ -1368,6 +1592,8 @@ class Microdot:
                 pass
             else:
                 raise
+        if self.access_log and req:
+            self.access_log.log(req, res, ticks_diff(ticks_ms(), start))
         if self.debug and req:  # pragma: no cover
             print('{method} {path} {status_code}'.format(
                 method=req.method, path=req.path,
@@ -0,0 +1,113 @@
+try:
+    from collections import OrderedDict
+except ImportError:  # pragma: no cover
+    from ucollections import OrderedDict
+
+from microdot import Response
+from microdot.helpers import ticks_ms, ticks_diff
+
+
+class RateLimiter:
+    """Limit the rate of requests accepted from each client.
+
+    :param app: The application to rate limit. If not given, the
+                :meth:`initialize` method must be called later.
+    :param rate: The number of requests per second that each client is
+                 allowed to make in a sustained way.
+    :param burst: The number of requests that a client is allowed to make in
+                  a quick burst before being limited. The default is to allow
+                  bursts of up to ``rate`` requests.
+    :param key_header: The name of a request header that identifies the
+                       client, for example ``X-Forwarded-For`` when the
+                       application runs behind a reverse proxy. If not given,
+                       clients are identified by their IP address. Behind a
+                       proxy that address is the proxy's (or empty, on a Unix
+                       socket), so without a header all the clients share one
+                       bucket.
+    :param max_clients: The maximum number of clients that are tracked. When
+                        a new client arrives and this limit has been reached,
+                        the client that has been idle the longest is forgotten.
+
+    Each client is given a token bucket that holds up to ``burst`` tokens and
+    is refilled at ``rate`` tokens per second. Every request takes a token
+    from the bucket. When the bucket is empty the request is answered with a
+    429 status code without invoking the route handler.
+
+    Example::
+
+        from microdot import Microdot
+        from microdot.ratelimit import RateLimiter
+
+        app = Microdot()
+        RateLimiter(app, rate=5, burst=10)
+    """
+    def __init__(self, app=None, rate=5, burst=None, key_header=None,
+                 max_clients=32):
+        self.rate = rate
+        self.burst = burst or rate
+        self.key_header = key_header
+        self.max_clients = max_clients
+        #: The number of requests that were rejected since the application
+        #: started.
+        self.limited = 0
+        self.buckets = OrderedDict()
+        self.retry_after = str(max(1, int(1 / rate + 0.5)))
+        if app:
+            self.initialize(app)
+
+    def initialize(self, app):
+        """Initialize the rate limiter for the given application.
+
+        :param app: The application to rate limit.
+        """
+        app.before_request(self.before_request)
+
+    def get_client_key(self, request):
+        """Return the key that identifies the client that sent a request.
+
+        :param request: The request object.
+
+        Subclasses can override this method to implement a different way to
+        identify clients.
+        """
+        if self.key_header:
+            key = request.headers.get(self.key_header)
+            if key:
+                return key.split(',', 1)[0].strip()
+        addr = request.client_addr
+        return addr[0] if isinstance(addr, (tuple, list)) else addr
+
+    def consume(self, key):
+        """Take a token from the bucket of the given client. Returns ``True``
+        if the request is allowed, or ``False`` if the client is over the
+        limit.
+
+        :param key: The key that identifies the client.
+        """
+        # tokens are stored in thousandths so that integer arithmetic can be
+        # used to refill the buckets
+        now = ticks_ms()
+        capacity = self.burst * 1000
+        bucket = self.buckets.pop(key, None)
+        if bucket is None:
+            if len(self.buckets) >= self.max_clients:
+                # forget the least recently seen client
+                del self.buckets[next(iter(self.buckets))]
+            bucket = [capacity, now]
+        else:
+            bucket[0] = min(capacity, bucket[0] + ticks_diff(
+                now, bucket[1]) * self.rate)
+            bucket[1] = now
+        self.buckets[key] = bucket  # move to the most recently used position
+        if bucket[0] < 1000:
+            return False
+        bucket[0] -= 1000
+        return True
+
+    async def before_request(self, request):
+        if self.consume(self.get_client_key(request)):
+            return
+        self.limited += 1
+        return Response(b'Too many requests', 429,
+                        {'Retry-After': self.retry_after},
+                        reason='Too Many Requests')
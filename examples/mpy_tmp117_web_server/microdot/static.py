@@ -0,0 +1,136 @@
+import os
+
+try:
+    from collections import OrderedDict
+except ImportError:  # pragma: no cover
+    from ucollections import OrderedDict
+
+from microdot import Response
+
+
+class StaticFiles:
+    """Serve the files in a directory, keeping the small ones in memory.
+
+    :param app: The application to add the static files route to. If not
+                given, the :meth:`initialize` method must be called later.
+    :param directory: The directory where the files are stored.
+    :param url_prefix: The URL prefix under which the files are served.
+    :param cache_size: The maximum number of bytes of file contents that are
+                       kept in memory. When adding a file to the cache would
+                       exceed this size, the least recently used files are
+                       evicted. Set to 0 to disable the cache.
+    :param max_cached_file_size: Files larger than this size are never cached
+                                 and are streamed from disk instead.
+    :param max_age: The ``Cache-Control`` header's ``max-age`` value in
+                    seconds. If omitted, the value of the
+                    :attr:`Response.default_send_file_max_age` attribute is
+                    used.
+
+    Cached files are served directly from memory, with their headers computed
+    when they were loaded. The modification time and size of the file are
+    checked on every request, so a file that changes on disk is reloaded.
+
+    Example::
+
+        from microdot import Microdot
+        from microdot.static import StaticFiles
+
+        app = Microdot()
+        static_files = StaticFiles(app, 'static', url_prefix='/static')
+
+        @app.route('/')
+        async def index(request):
+            return static_files.serve('index.html')
+    """
+    def __init__(self, app=None, directory='static', url_prefix='/static',
+                 cache_size=16 * 1024, max_cached_file_size=8 * 1024,
+                 max_age=None):
+        self.directory = directory.rstrip('/')
+        self.url_prefix = url_prefix.rstrip('/')
+        self.cache_size = cache_size
+        self.max_cached_file_size = max_cached_file_size
+        self.max_age = max_age
+        self.cache = OrderedDict()
+        #: The number of bytes currently held in the cache.
+        self.cached_bytes = 0
+        #: The number of requests that were served from the cache.
+        self.hits = 0
+        #: The number of requests that had to read the file from disk.
+        self.misses = 0
+        if app:
+            self.initialize(app)
+
+    def initialize(self, app):
+        """Add the static files route to the given application.
+
+        :param app: The application to add the route to.
+        """
+        app.route(self.url_prefix + '/<path:path>')(self.handle_request)
+
+    async def handle_request(self, request, path):
+        return self.serve(path)
+
+    @staticmethod
+    def normalize_path(path):
+        """Return a safe relative version of the given path, or ``None`` if
+        the path tries to escape the static directory.
+
+        :param path: The path of the file, relative to the static directory.
+        """
+        parts = []
+        for part in path.replace('\\', '/').split('/'):
+            if part == '' or part == '.':
+                continue
+            if part == '..' or '\x00' in part:
+                return None
+            parts.append(part)
+        return '/'.join(parts) if parts else None
+
+    def serve(self, path):
+        """Return a response with the contents of a file.
+
+        :param path: The path of the file, relative to the static directory.
+
+        A 404 response is returned if the file does not exist or the path is
+        not valid.
+        """
+        path = self.normalize_path(path)
+        if path is None:
+            return 'Not found', 404
+        filename = self.directory + '/' + path
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return 'Not found', 404
+        if st[0] & 0x4000:  # directories cannot be served
+            return 'Not found', 404
+        mtime, size = st[8], st[6]
+
+        entry = self.cache.pop(path, None)
+        if entry is not None:
+            if entry[0] == mtime and len(entry[1]) == size:
+                self.cache[path] = entry  # move to the most recently used end
+                self.hits += 1
+                return Response(entry[1], headers=entry[2])
+            self.cached_bytes -= len(entry[1])
+
+        self.misses += 1
+        if size > self.max_cached_file_size or size > self.cache_size:
+            return Response.send_file(filename, max_age=self.max_age)
+        with open(filename, 'rb') as f:
+            body = f.read()
+        headers = {
+            'Content-Type': Response.types_map.get(
+                path.split('.')[-1], 'application/octet-stream'),
+            'Content-Length': str(len(body)),
+        }
+        max_age = self.max_age if self.max_age is not None \
+            else Response.default_send_file_max_age
+        if max_age is not None:
+            headers['Cache-Control'] = 'max-age={}'.format(max_age)
+        while self.cache and self.cached_bytes + len(body) > self.cache_size:
+            evicted = self.cache.pop(next(iter(self.cache)))
+            self.cached_bytes -= len(evicted[1])
+        self.cache[path] = (mtime, body, headers)
+        self.cached_bytes += len(body)
+        return Response(body, headers=headers)
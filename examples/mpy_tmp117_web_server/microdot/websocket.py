@@ -1,8 +1,86 @@
+import asyncio
 import binascii
 import hashlib
+import json
+import sys
+try:
+    import zlib
+    if not hasattr(zlib, 'compressobj'):  # pragma: no cover
+        # MicroPython's zlib module can only decompress
+        zlib = None
+except ImportError:  # pragma: no cover
+    zlib = None
 from microdot import Request, Response
 from microdot.microdot import MUTED_SOCKET_ERRORS, print_exception
-from microdot.helpers import wraps
+from microdot.helpers import wraps, ticks_ms, ticks_diff
+
+_micropython = sys.implementation.name == 'micropython'
+# transports gather the buffers given to writelines() instead of joining
+# them since CPython 3.12
+_vectored_writes = not _micropython and sys.version_info >= (3, 12)
+_numpy = None
+
+#: Client frames with payloads of at least this many bytes are unmasked with
+#: NumPy, if it is installed. Only used on CPython.
+UNMASK_NUMPY_THRESHOLD = 64 * 1024
+
+
+def _unmask_int(payload, mask):
+    # XOR the whole payload in one operation by treating it and a repeated
+    # copy of the mask as big integers
+    n = len(payload)
+    if n == 0:
+        return b''
+    mask = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, 'big') ^
+            int.from_bytes(mask, 'big')).to_bytes(n, 'big')
+
+
+def _unmask_inplace(buf, mask, start=0, end=None):
+    # XOR a bytearray or writable memoryview in place, without allocating a
+    # second buffer
+    if end is None:
+        end = len(buf)
+    m0, m1, m2, m3 = mask[0], mask[1], mask[2], mask[3]
+    i = start
+    last = end - 3
+    while i < last:
+        buf[i] ^= m0
+        buf[i + 1] ^= m1
+        buf[i + 2] ^= m2
+        buf[i + 3] ^= m3
+        i += 4
+    j = 0
+    while i < end:
+        buf[i] ^= mask[j]
+        i += 1
+        j += 1
+    return buf
+
+
+def _unmask_numpy(payload, mask):
+    n = len(payload)
+    data = _numpy.frombuffer(payload, dtype=_numpy.uint8)
+    key = _numpy.resize(_numpy.frombuffer(mask, dtype=_numpy.uint8), n)
+    return (data ^ key).tobytes()
+
+
+def _unmask(payload, mask):
+    # CPython XORs big integers in C, and can hand very large payloads to
+    # NumPy when it is installed. MicroPython unmasks a bytearray in place to
+    # keep memory use down.
+    global _numpy
+    if _micropython:  # pragma: no cover
+        return bytes(_unmask_inplace(bytearray(payload), mask))
+    if len(payload) >= UNMASK_NUMPY_THRESHOLD:
+        if _numpy is None:
+            try:
+                import numpy as _numpy
+            except ImportError:
+                _numpy = False
+        if _numpy:
+            return _unmask_numpy(payload, mask)
+    return _unmask_int(payload, mask)
 
 
 class WebSocketError(Exception):
@@ -23,6 +101,10 @@ class WebSocket:
     PING = 9
     PONG = 10
 
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop_oldest'
+    KEEP_LATEST = 'keep_latest'
+
     #: Specify the maximum message size that can be received when calling the
     #: ``receive()`` method. Messages with payloads that are larger than this
     #: size will be rejected and the connection closed. Set to 0 to disable
@@ -35,47 +117,546 @@ class WebSocket:
     #:    WebSocket.max_message_length = 4 * 1024  # up to 4KB messages
     max_message_length = -1
 
+    #: The size of the buffer used to receive frames. Several small frames
+    #: can be parsed from a single read of the socket into this buffer, and
+    #: frames with payloads that do not fit in it are read directly from the
+    #: socket.
+    receive_buffer_size = 256
+
+    #: The size of the buffer used to send frames. Frames with payloads that
+    #: fit in this buffer are assembled in it and written with a single call.
+    #: Larger frames are written as a header and a payload, without copying
+    #: the payload, in a single vectored write where the platform supports
+    #: it.
+    send_buffer_size = 1024
+
+    #: Specify the maximum payload size of the frames sent by the ``send()``
+    #: method. Messages that are larger are split into several frames. Set to
+    #: 0 to always send messages in a single frame. The default is 0.
+    #:
+    #: Example::
+    #:
+    #:    WebSocket.max_fragment_size = 1024  # fragment messages above 1KB
+    max_fragment_size = 0
+
+    #: Set to ``True`` to compress messages with the ``permessage-deflate``
+    #: extension when the client supports it. Compression requires the
+    #: ``zlib`` module with compression support, so it is only available on
+    #: CPython. The default is ``False``.
+    permessage_deflate = False
+
+    #: Set to ``False`` to compress each message independently. Keeping the
+    #: compression context between messages gives much better compression of
+    #: repetitive messages, at the cost of keeping the compression state in
+    #: memory for the life of the connection. The default is ``True``.
+    deflate_context_takeover = True
+
+    #: The base two logarithm of the compression window size, from 9 to 15.
+    #: Together with ``deflate_mem_level`` this caps the memory used by each
+    #: connection for compression. Clients that cannot limit their own window
+    #: to this size are not offered compression. The default is 11 (a 2KB
+    #: window).
+    deflate_window_bits = 11
+
+    #: The zlib memory level of the compressor, from 1 to 9. Lower values use
+    #: less memory. The default is 4.
+    deflate_mem_level = 4
+
+    #: Messages shorter than this number of bytes are sent uncompressed. The
+    #: default is 16.
+    deflate_min_length = 16
+
+    #: The subprotocols that the server accepts. When the client offers
+    #: subprotocols in the ``Sec-WebSocket-Protocol`` header, the first one
+    #: offered that is in this list is accepted and stored in the
+    #: ``subprotocol`` attribute of the connection. The default is an empty
+    #: list, which does not accept any subprotocol.
+    #:
+    #: Example::
+    #:
+    #:    WebSocket.subprotocols = ['sensor.v1', 'sensor.v2']
+    subprotocols = []
+
+    #: The number of outgoing messages that can be queued for each
+    #: connection. When set, ``send()`` adds messages to a queue that a
+    #: background task writes to the client, so that a slow client does not
+    #: hold up the task that sends to it. Set to 0 to write messages directly.
+    #: The default is 0.
+    send_queue_size = 0
+
+    #: What ``send()`` does when the send queue is full. With ``BLOCK`` it
+    #: waits until there is space in the queue. With ``DROP_OLDEST`` the
+    #: oldest queued message is discarded to make room. With ``KEEP_LATEST``
+    #: any messages that are still queued are discarded every time a new
+    #: message is sent, so that a slow client always receives the most
+    #: recent message. Control frames, messages sent with
+    #: ``droppable=False`` and messages sent with ``send_stream()`` are never
+    #: discarded. Everything but the close frame waits for space in the
+    #: queue instead, once the messages the policy allows to discard are
+    #: gone, and a queued pong is replaced by the answer to a newer ping. The
+    #: default is ``BLOCK``.
+    #:
+    #: Example::
+    #:
+    #:    WebSocket.send_queue_size = 4
+    #:    WebSocket.send_queue_policy = WebSocket.KEEP_LATEST
+    send_queue_policy = BLOCK
+
+    #: The number of seconds a connection can go without receiving anything
+    #: from the client before the server sends it a ``PING`` frame. Set to 0
+    #: to never send pings. The default is 0.
+    ping_interval = 0
+
+    #: The number of seconds the client has to answer a ``PING`` frame. A
+    #: connection that does not receive a ``PONG`` frame, or any other data,
+    #: within this time is considered dead and is closed, which ends its
+    #: handler. The default is 10.
+    ping_timeout = 10
+
+    #: Counters for the websocket connections of the application.
+    #: ``active`` is the number of connections that are open, and ``idle``
+    #: the number of those that are waiting for the answer to a ``PING``
+    #: because the client has not sent anything for ``ping_interval``
+    #: seconds. ``timed_out`` is the number of connections that were closed
+    #: because the client did not answer a ``PING`` in time.
+    connections = {'active': 0, 'idle': 0, 'timed_out': 0}
+
     def __init__(self, request):
         self.request = request
         self.closed = False
+        #: The subprotocol accepted for this connection, or ``None`` if the
+        #: client did not offer any of the supported subprotocols.
+        self.subprotocol = None
+        self._rbuf = None
+        self._rstart = 0
+        self._rend = 0
+        self._sbuf = None
+        self._sview = None
+        self._fragmented_opcode = None
+        self._deflater = None
+        self._inflater = None
+        self._inflating = False
+        self._deflate_flush = None
+        self._hubs = []
+        self._queue = None
+        self._queue_ready = None
+        self._queue_space = None
+        self._writer_task = None
+        self._write_error = None
+        self._send_lock = None
+        self._keepalive_task = None
+        self._reader_task = None
+        self._aborted = False
+        self._alive = False
+        self._idle = False
+        #: The number of queued messages that were discarded by the send
+        #: queue policy.
+        self.dropped = 0
+
+    @property
+    def queue_depth(self):
+        """The number of messages waiting in the send queue."""
+        return len(self._queue) if self._queue else 0
 
     async def handshake(self):
         response = self._handshake_response()
+        extensions = self._negotiate_deflate()
+        self.subprotocol = self._negotiate_subprotocol()
         await self.request.sock[1].awrite(
             b'HTTP/1.1 101 Switching Protocols\r\n')
         await self.request.sock[1].awrite(b'Upgrade: websocket\r\n')
         await self.request.sock[1].awrite(b'Connection: Upgrade\r\n')
+        if extensions:
+            await self.request.sock[1].awrite(
+                b'Sec-WebSocket-Extensions: ' + extensions + b'\r\n')
+        if self.subprotocol:
+            await self.request.sock[1].awrite(
+                b'Sec-WebSocket-Protocol: ' + self.subprotocol.encode() +
+                b'\r\n')
         await self.request.sock[1].awrite(
             b'Sec-WebSocket-Accept: ' + response + b'\r\n\r\n')
+        WebSocket.connections['active'] += 1
+        if self.ping_interval:
+            self._keepalive_task = asyncio.create_task(self._keepalive())
 
     async def receive(self):
-        """Receive a message from the client."""
+        """Receive a message from the client.
+
+        Messages that the client sent fragmented in several frames are
+        returned once all the fragments have been received.
+        """
         while True:
-            opcode, payload = await self._read_frame()
-            send_opcode, data = self._process_websocket_frame(opcode, payload)
-            if send_opcode:  # pragma: no cover
-                await self.send(data, send_opcode)
-            elif data:  # pragma: no branch
+            fin, opcode, payload = await self._read_data_frame()
+            if not fin:
+                max_allowed_length = self._max_allowed_length()
+                fragments = [payload]
+                length = len(payload)
+                while not fin:
+                    fin, _, payload = await self._read_data_frame()
+                    length += len(payload)
+                    if max_allowed_length and length > max_allowed_length:
+                        raise WebSocketError('Message too large')
+                    fragments.append(payload)
+                payload = b''.join(fragments)
+            _, data = self._process_websocket_frame(opcode, payload)
+            if data:  # pragma: no branch
                 return data
 
-    async def send(self, data, opcode=None):
+    def receive_stream(self):
+        """Receive a message from the client in fragments, as they arrive.
+
+        This method returns an asynchronous iterator that yields the payload
+        of each frame of the next message as bytes, so that large messages can
+        be processed without holding them in memory. The ``opcode`` attribute
+        of the iterator indicates if the message is ``TEXT`` or ``BINARY``.
+        The ``max_message_length`` limit applies to each fragment instead of
+        to the whole message. Example::
+
+            @app.route('/upload')
+            @with_websocket
+            async def upload(request, ws):
+                with open('upload.bin', 'wb') as f:
+                    async for fragment in ws.receive_stream():
+                        f.write(fragment)
+        """
+        return _MessageStream(self)
+
+    async def send(self, data, opcode=None, fragment_size=None,
+                   droppable=True):
         """Send a message to the client.
 
-        :param data: the data to send, given as a string or bytes.
+        :param data: the data to send, given as a string, bytes, or a
+                     bytearray or memoryview, which can be reused as soon as
+                     this method returns.
         :param opcode: a custom frame opcode to use. If not given, the opcode
                        is ``TEXT`` or ``BINARY`` depending on the type of the
                        data.
+        :param fragment_size: the maximum payload size of each frame. Larger
+                              messages are sent fragmented in several frames.
+                              If not given, the value of
+                              ``max_fragment_size`` is used.
+        :param droppable: set to ``False`` for a message that must reach the
+                          client, such as a reply to a request. When the send
+                          queue is enabled, such a message is never discarded
+                          by ``send_queue_policy``. When the queue is full of
+                          messages that cannot be discarded, it waits for
+                          space, even with the ``KEEP_LATEST`` and
+                          ``DROP_OLDEST`` policies.
         """
-        frame = self._encode_websocket_frame(
-            opcode or (self.TEXT if isinstance(data, str) else self.BINARY),
-            data)
-        await self.request.sock[1].awrite(frame)
+        opcode = opcode or (self.TEXT if isinstance(data, str)
+                            else self.BINARY)
+        if fragment_size is None:
+            fragment_size = self.max_fragment_size
+        if self.closed and opcode != self.CLOSE:
+            raise WebSocketError('Websocket connection closed')
+        if opcode >= self.CLOSE:
+            # control frames can be sent between the fragments of a message
+            await self._send_message(data, opcode, fragment_size, droppable)
+            return
+        async with self._lock():
+            await self._send_message(data, opcode, fragment_size, droppable)
+
+    async def _send_message(self, data, opcode, fragment_size, droppable):
+        if self.send_queue_size:
+            # the message is written after send() returns, so a buffer that
+            # the caller may reuse is copied
+            data = _immutable(data)
+            if opcode == self.PONG and self._replace_pong(data):
+                return
+            if opcode == self.CLOSE:
+                # the close frame is never dropped or delayed
+                await self._enqueue(self._write_message,
+                                    (data, opcode, fragment_size),
+                                    droppable=False, block=False)
+            elif opcode >= self.CLOSE or not droppable:
+                # pings, pongs and messages that must be delivered are never
+                # dropped, but they count against the size of the queue like
+                # any other message
+                await self._enqueue(self._write_message,
+                                    (data, opcode, fragment_size),
+                                    droppable=False)
+            else:
+                await self._enqueue(self._write_message,
+                                    (data, opcode, fragment_size))
+        else:
+            await self._write_message(data, opcode, fragment_size)
+
+    def _replace_pong(self, data):
+        # a client only needs an answer to its most recent ping, so a pong
+        # that is still queued gets the new payload instead of queueing
+        # another one (the items of _write_message have 3 arguments)
+        for i, item in enumerate(self._queue or []):
+            if item and len(item[1]) == 3 and item[1][1] == self.PONG:
+                self._queue[i] = (item[0], (data, self.PONG, item[1][2]),
+                                  item[2])
+                return True
+        return False
+
+    def _lock(self):
+        # the lock that keeps the frames of a fragmented message together, so
+        # that no other message is sent between them. It is created on first
+        # use so that it belongs to the running loop
+        if self._send_lock is None:
+            self._send_lock = asyncio.Lock()
+        return self._send_lock
+
+    async def _write_message(self, data, opcode, fragment_size):
+        compressed = False
+        if self._deflater and opcode < self.CLOSE and \
+                len(data) >= self.deflate_min_length:
+            data = self._deflate(data, True)
+            compressed = True
+        if isinstance(data, str):
+            data = data.encode()
+        if not fragment_size or len(data) <= fragment_size or \
+                opcode >= self.CLOSE:
+            await self._write_parts(opcode, data, compressed=compressed)
+            return
+        data = memoryview(data)
+        for i in range(0, len(data), fragment_size):
+            await self._write_parts(
+                opcode if i == 0 else self.CONT, data[i:i + fragment_size],
+                fin=i + fragment_size >= len(data),
+                compressed=compressed and i == 0)
+
+    async def send_stream(self, fragments, binary=True):
+        """Send a message to the client from an iterable of fragments. Each
+        fragment is sent in its own frame as soon as it is produced, so that
+        the whole message never needs to be in memory. Other messages sent to
+        the connection wait until the stream ends, as they cannot be sent
+        between its frames. Control frames can still be sent between them.
+
+        :param fragments: an iterable or asynchronous iterable that yields
+                          the fragments of the message, as strings or bytes.
+        :param binary: ``True`` to send a ``BINARY`` message, or ``False`` to
+                       send a ``TEXT`` message.
+
+        Example::
+
+            def read_file(filename):
+                with open(filename, 'rb') as f:
+                    while True:
+                        chunk = f.read(1024)
+                        if not chunk:
+                            break
+                        yield chunk
+
+            await ws.send_stream(read_file('log.bin'))
+        """
+        async with self._lock():
+            await self._send_fragments(fragments, binary)
+
+    async def _send_fragments(self, fragments, binary):
+        opcode = self.BINARY if binary else self.TEXT
+        compressed = self._deflater is not None
+        previous = None
+        if hasattr(fragments, '__aiter__'):
+            iterator = fragments.__aiter__()
+            while True:
+                try:
+                    fragment = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                if previous is not None:
+                    await self._send_fragment(opcode, previous, False,
+                                              compressed)
+                    opcode = self.CONT
+                previous = fragment
+        else:
+            for fragment in fragments:
+                if previous is not None:
+                    await self._send_fragment(opcode, previous, False,
+                                              compressed)
+                    opcode = self.CONT
+                previous = fragment
+        await self._send_fragment(opcode, previous or b'', True, compressed)
 
     async def close(self):
         """Close the websocket connection."""
         if not self.closed:  # pragma: no cover
-            self.closed = True
+            if self._keepalive_task:
+                self._keepalive_task.cancel()
+                self._keepalive_task = None
+            self._release()
             await self.send(b'', self.CLOSE)
+            if self._writer_task:
+                # let the writer task send the queued messages and the close
+                # frame before it ends
+                self._queue.append(None)
+                self._queue_ready.set()
+                await self._writer_task
+
+    def _release(self):
+        # mark the connection as closed and release its resources
+        self.closed = True
+        for hub in self._hubs[:]:
+            hub.unsubscribe(self)
+        self._set_idle(False)
+        WebSocket.connections['active'] -= 1
+
+    def _set_idle(self, idle):
+        if idle != self._idle:
+            self._idle = idle
+            WebSocket.connections['idle'] += 1 if idle else -1
+
+    async def _keepalive(self):
+        # background task that pings the client when the connection has been
+        # quiet for ping_interval seconds, and closes the connection if the
+        # client does not answer within ping_timeout seconds
+        while not self.closed:
+            self._alive = False
+            await asyncio.sleep(self.ping_interval)
+            if self._alive or self.closed:
+                continue
+            self._set_idle(True)
+            start = ticks_ms()
+            try:
+                await asyncio.wait_for(self.send(b'', self.PING),
+                                       self.ping_timeout)
+            except Exception:
+                # the ping could not be written in time, so the client is
+                # not reading anymore
+                self._expire()
+                return
+            remaining = self.ping_timeout * 1000 - ticks_diff(ticks_ms(),
+                                                               start)
+            if remaining > 0:
+                await asyncio.sleep(remaining / 1000)
+            if not self._alive and not self.closed:
+                self._expire()
+                return
+
+    def _expire(self):
+        # the client is gone, so the connection is dropped without waiting
+        # for the messages that are still queued or being written
+        self._keepalive_task = None
+        WebSocket.connections['timed_out'] += 1
+        self._release()
+        self._abort()
+
+    def _disconnect(self):
+        # drop a client that does not read the messages it must receive
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        self._release()
+        self._abort()
+
+    def _abort(self):
+        # stop writing to the client, wake up any senders waiting for space
+        # in the queue, and cancel the read the handler is waiting on, which
+        # makes it exit with an error so that the server frees the socket.
+        # Closing the stream does not wake up a pending read on MicroPython
+        self._aborted = True
+        self._write_error = WebSocketError('Websocket connection closed')
+        if self._writer_task:
+            self._writer_task.cancel()
+            self._writer_task = None
+            del self._queue[:]
+            self._queue_space.set()
+        if self._reader_task:
+            self._reader_task.cancel()
+        writer = self.request.sock[1]
+        transport = getattr(writer, 'transport', None)
+        if transport is not None:
+            # discard the unsent data, so that closing the connection does
+            # not wait for a client that is not reading anymore
+            transport.abort()
+        else:  # pragma: no cover
+            # MicroPython streams keep the socket in their s attribute, and
+            # closing it makes pending reads and writes fail
+            getattr(writer, 's', writer).close()
+
+    async def _send_frame(self, frame, droppable=True):
+        # send a frame that was already encoded
+        async with self._lock():
+            await self._send_encoded(frame, droppable)
+
+    async def _send_encoded(self, frame, droppable):
+        if self.send_queue_size:
+            await self._enqueue(self._write_frame, (frame,),
+                                droppable=droppable)
+        else:
+            await self._write_frame(frame)
+
+    async def _write_frame(self, frame):
+        await self.request.sock[1].awrite(frame)
+
+    async def _enqueue(self, write, args, droppable=True, block=None):
+        # add a message to the send queue, applying the queue policy
+        if self._write_error:
+            raise self._write_error
+        if self._queue is None:
+            self._queue = []
+            self._queue_ready = asyncio.Event()
+            self._queue_space = asyncio.Event()
+            self._writer_task = asyncio.create_task(self._writer())
+        queue = self._queue
+        policy = self.send_queue_policy
+        if block is None:
+            block = not droppable or policy == self.BLOCK
+        if droppable and policy == self.KEEP_LATEST:
+            self._drop(len(queue))
+        elif droppable and policy == self.DROP_OLDEST:
+            if len(queue) >= self.send_queue_size:
+                self._drop(1)
+        elif block:
+            if policy != self.BLOCK and len(queue) >= self.send_queue_size:
+                # make room by discarding the messages the policy allows
+                self._drop(len(queue) - self.send_queue_size + 1)
+            while len(queue) >= self.send_queue_size:
+                self._queue_space.clear()
+                await self._queue_space.wait()
+                if self._write_error:
+                    raise self._write_error
+        queue.append((write, args, droppable))
+        self._queue_ready.set()
+
+    def _has_room(self):
+        # whether a message that cannot be dropped can be queued right away,
+        # once the messages the policy allows to discard are gone
+        queue = self._queue
+        if not self.send_queue_size or not queue:
+            return True
+        if self.send_queue_policy == self.BLOCK:
+            return len(queue) < self.send_queue_size
+        kept = 0
+        for item in queue:
+            if not item[2]:
+                kept += 1
+        return kept < self.send_queue_size
+
+    def _drop(self, count):
+        # discard up to count of the oldest droppable messages in the queue
+        i = 0
+        while count and i < len(self._queue):
+            if self._queue[i][2]:
+                self._queue.pop(i)
+                self.dropped += 1
+                count -= 1
+            else:
+                i += 1
+
+    async def _writer(self):
+        # background task that writes the queued messages to the client
+        queue = self._queue
+        while True:
+            while not queue:
+                self._queue_ready.clear()
+                await self._queue_ready.wait()
+            item = queue.pop(0)
+            self._queue_space.set()
+            if item is None:
+                return
+            try:
+                await item[0](*item[1])
+            except Exception as exc:
+                # the connection is broken, so senders are woken up with the
+                # error and the remaining messages are discarded
+                self._write_error = exc
+                del queue[:]
+                self._queue_space.set()
+                return
 
     def _handshake_response(self):
         connection = False
@@ -99,19 +680,102 @@ class WebSocket:
         d.update(b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11')
         return binascii.b2a_base64(d.digest())[:-1]
 
+    def _negotiate_subprotocol(self):
+        # accept the first subprotocol offered by the client that the server
+        # supports
+        offers = self.request.headers.get('Sec-WebSocket-Protocol')
+        if not offers or not self.subprotocols:
+            return None
+        for offer in offers.split(','):
+            offer = offer.strip()
+            if offer in self.subprotocols:
+                return offer
+        return None
+
+    def _negotiate_deflate(self):
+        # accept the first permessage-deflate offer from the client that fits
+        # the configured memory limits, and return the extension response
+        if not self.permessage_deflate or zlib is None:
+            return None
+        offers = self.request.headers.get('Sec-WebSocket-Extensions')
+        if not offers:
+            return None
+        window_bits = max(9, min(15, self.deflate_window_bits))
+        for offer in offers.split(','):
+            params = [p.strip() for p in offer.split(';')]
+            if params[0].lower() != 'permessage-deflate':
+                continue
+            server_bits = window_bits
+            client_bits = None
+            no_context_takeover = not self.deflate_context_takeover
+            try:
+                for param in params[1:]:
+                    name, _, value = param.partition('=')
+                    name = name.strip().lower()
+                    value = value.strip().strip('"')
+                    if name == 'server_no_context_takeover':
+                        no_context_takeover = True
+                    elif name == 'server_max_window_bits':
+                        server_bits = min(server_bits, int(value))
+                    elif name == 'client_max_window_bits':
+                        client_bits = min(window_bits, int(value or 15))
+            except ValueError:  # pragma: no cover
+                continue
+            if server_bits < 9 or client_bits is None or client_bits < 9:
+                # zlib cannot compress with a window smaller than 512
+                # bytes, and a client that cannot reduce its window size
+                # would need more memory than allowed to decompress
+                continue
+            self._deflater = zlib.compressobj(
+                6, zlib.DEFLATED, -server_bits, self.deflate_mem_level)
+            self._inflater = zlib.decompressobj(-client_bits)
+            self._deflate_flush = zlib.Z_FULL_FLUSH if no_context_takeover \
+                else zlib.Z_SYNC_FLUSH
+            response = 'permessage-deflate; server_max_window_bits={}; ' \
+                'client_max_window_bits={}'.format(server_bits, client_bits)
+            if no_context_takeover:
+                response += '; server_no_context_takeover'
+            if not self.deflate_context_takeover:
+                response += '; client_no_context_takeover'
+            return response.encode()
+        return None
+
+    def _deflate(self, data, final):
+        # compress a message or a fragment of a message
+        if isinstance(data, str):
+            data = data.encode()
+        data = self._deflater.compress(data) + \
+            self._deflater.flush(self._deflate_flush)
+        if final and data.endswith(b'\x00\x00\xff\xff'):
+            data = data[:-4]
+        return data
+
+    def _inflate(self, data, final):
+        # decompress a fragment of a message, enforcing the message size limit
+        if final:
+            data = data + b'\x00\x00\xff\xff'
+        max_allowed_length = self._max_allowed_length()
+        if max_allowed_length:
+            data = self._inflater.decompress(data, max_allowed_length)
+            if self._inflater.unconsumed_tail:
+                raise WebSocketError('Message too large')
+            return data
+        return self._inflater.decompress(data)
+
     @classmethod
     def _parse_frame_header(cls, header):
         fin = header[0] & 0x80
+        compressed = header[0] & 0x40
         opcode = header[0] & 0x0f
-        if fin == 0 or opcode == cls.CONT:  # pragma: no cover
-            raise WebSocketError('Continuation frames not supported')
+        if opcode >= cls.CLOSE and fin == 0:  # pragma: no cover
+            raise WebSocketError('Control frames cannot be fragmented')
         has_mask = header[1] & 0x80
         length = header[1] & 0x7f
         if length == 126:
             length = -2
         elif length == 127:
             length = -8
-        return fin, opcode, has_mask, length
+        return fin, opcode, has_mask, length, compressed
 
     def _process_websocket_frame(self, opcode, payload):
         if opcode == self.TEXT:
@@ -127,10 +791,12 @@ class WebSocket:
         return None, payload
 
     @classmethod
-    def _encode_websocket_frame(cls, opcode, payload):
+    def _encode_websocket_frame(cls, opcode, payload, fin=True,
+                                compressed=False):
         frame = bytearray()
-        frame.append(0x80 | opcode)
-        if opcode == cls.TEXT:
+        frame.append((0x80 if fin else 0) | (0x40 if compressed else 0) |
+                     opcode)
+        if isinstance(payload, str):
             payload = payload.encode()
         if len(payload) < 126:
             frame.append(len(payload))
@@ -143,27 +809,343 @@ class WebSocket:
         frame.extend(payload)
         return frame
 
-    async def _read_frame(self):
-        header = await self.request.sock[0].read(2)
-        if len(header) != 2:  # pragma: no cover
-            raise WebSocketError('Websocket connection closed')
-        fin, opcode, has_mask, length = self._parse_frame_header(header)
-        if length == -2:
-            length = await self.request.sock[0].read(2)
-            length = int.from_bytes(length, 'big')
-        elif length == -8:
-            length = await self.request.sock[0].read(8)
-            length = int.from_bytes(length, 'big')
-        max_allowed_length = Request.max_body_length \
+    async def _send_fragment(self, opcode, payload, fin, compressed=False):
+        if self.send_queue_size:
+            await self._enqueue(self._write_fragment,
+                                (opcode, _immutable(payload), fin, compressed),
+                                droppable=False)
+        else:
+            await self._write_fragment(opcode, payload, fin, compressed)
+
+    async def _write_fragment(self, opcode, payload, fin, compressed):
+        if compressed:
+            payload = self._deflate(payload, fin)
+        elif isinstance(payload, str):
+            payload = payload.encode()
+        await self._write_parts(opcode, payload, fin=fin,
+                                compressed=compressed and opcode != self.CONT)
+
+    def _encode_frame_header(self, opcode, length, fin, compressed):
+        # encode a frame header so that it ends at offset 10 of the send
+        # buffer, right before where the payload goes, and return its start
+        buf = self._sbuf
+        if buf is None:
+            buf = self._sbuf = bytearray(10 + self.send_buffer_size)
+            self._sview = memoryview(buf)
+        if length < 126:
+            start = 8
+            buf[9] = length
+        elif length < (1 << 16):
+            start = 6
+            buf[7] = 126
+            buf[8] = length >> 8
+            buf[9] = length & 0xff
+        else:
+            start = 0
+            buf[1] = 127
+            for i in range(8):
+                buf[2 + i] = (length >> (56 - 8 * i)) & 0xff
+        buf[start] = (0x80 if fin else 0) | (0x40 if compressed else 0) | \
+            opcode
+        return start
+
+    async def _write_parts(self, opcode, payload, fin=True, compressed=False):
+        # write a frame without building it in a new buffer. The payload can
+        # be bytes, a bytearray or a memoryview, and can be reused by the
+        # caller once this method returns. Messages that go through the send
+        # queue are written after send() returns, so send() copies mutable
+        # payloads before queueing them
+        length = len(payload)
+        start = self._encode_frame_header(opcode, length, fin, compressed)
+        writer = self.request.sock[1]
+        # CPython transports keep a reference to the data they cannot send
+        # right away, while MicroPython streams copy it
+        transport = getattr(writer, 'transport', None)
+        if length <= self.send_buffer_size:
+            # small frames are cheaper to copy than to gather
+            end = 10 + length
+            self._sbuf[10:end] = payload
+            frame = self._sview[start:end]
+            if transport is None:
+                await writer.awrite(frame)
+                return
+            writer.write(frame)
+            if transport.get_write_buffer_size():
+                self._sbuf = None  # the next frame needs another buffer
+            await writer.drain()
+            return
+        header = self._sview[start:10]
+        if transport is None:
+            if hasattr(writer, 'drain'):
+                # both parts are queued before yielding, so that a frame sent
+                # by another task cannot be written between them
+                writer.write(header)
+                writer.write(payload)
+                await writer.drain()
+            else:  # pragma: no cover
+                await writer.awrite(bytes(header) + bytes(payload))
+            return
+        if _vectored_writes:
+            writer.writelines((header, payload))
+        else:
+            writer.write(header)
+            writer.write(payload)
+        if transport.get_write_buffer_size():
+            self._sbuf = None
+            if not isinstance(payload, bytes):
+                # wait until all of the payload is handed to the socket, so
+                # that the caller can reuse its buffer
+                low, high = transport.get_write_buffer_limits()
+                transport.set_write_buffer_limits(0)
+                await writer.drain()
+                transport.set_write_buffer_limits(high, low)
+                return
+        await writer.drain()
+
+    def _max_allowed_length(self):
+        return Request.max_body_length \
             if self.max_message_length == -1 else self.max_message_length
-        if length > max_allowed_length:
+
+    async def _read_data_frame(self):
+        # return the next frame of a data message as a (fin, opcode, payload)
+        # tuple, replying to any control frames that arrive before it
+        while True:
+            fin, opcode, payload, compressed = await self._read_frame()
+            if compressed and (self._inflater is None or
+                               opcode == self.CONT or opcode >= self.CLOSE):
+                raise WebSocketError('Unexpected compressed frame')
+            if opcode == self.CONT:
+                if self._fragmented_opcode is None:  # pragma: no cover
+                    raise WebSocketError('Unexpected continuation frame')
+                opcode = self._fragmented_opcode
+            elif opcode < self.CLOSE:
+                if self._fragmented_opcode is not None:  # pragma: no cover
+                    raise WebSocketError('Expected continuation frame')
+                self._inflating = bool(compressed)
+            else:
+                send_opcode, data = self._process_websocket_frame(
+                    opcode, payload)
+                if send_opcode:  # pragma: no cover
+                    await self.send(data, send_opcode)
+                continue
+            self._fragmented_opcode = None if fin else opcode
+            if self._inflating:
+                payload = self._inflate(payload, fin)
+            return fin, opcode, payload
+
+    async def _fill(self, n):
+        # make sure at least n bytes are available in the receive buffer,
+        # reading from the socket as many times as necessary
+        buf = self._rbuf
+        if buf is None:
+            buf = self._rbuf = bytearray(self.receive_buffer_size)
+        available = self._rend - self._rstart
+        if available >= n:
+            return
+        if self._rstart + n > len(buf):
+            # move the unread bytes to the start of the buffer
+            buf[:available] = buf[self._rstart:self._rend]
+            self._rstart = 0
+            self._rend = available
+        stream = self.request.sock[0]
+        while self._rend - self._rstart < n:
+            if hasattr(stream, 'readinto'):  # pragma: no cover
+                count = await self._read(stream.readinto,
+                                         memoryview(buf)[self._rend:])
+            else:
+                data = await self._read(stream.read, len(buf) - self._rend)
+                count = len(data)
+                buf[self._rend:self._rend + count] = data
+            if not count:
+                raise WebSocketError('Websocket connection closed')
+            self._rend += count
+            self._alive = True
+            if self._idle:
+                self._set_idle(False)
+
+    async def _read(self, read, arg):
+        # read from the socket in a way that _abort() can interrupt
+        if self._aborted:
+            raise WebSocketError('Websocket connection closed')
+        self._reader_task = asyncio.current_task()
+        try:
+            return await read(arg)
+        except asyncio.CancelledError:
+            if not self._aborted:
+                raise
+            # the cancellation came from _abort(), so it is reported as an
+            # error of the connection instead
+            task = self._reader_task
+            if hasattr(task, 'uncancel'):
+                task.uncancel()
+            raise WebSocketError('Websocket connection closed')
+        finally:
+            self._reader_task = None
+
+    async def _read_frame(self):
+        await self._fill(2)
+        buf = self._rbuf
+        pos = self._rstart
+        fin, opcode, has_mask, length, compressed = \
+            self._parse_frame_header(buf[pos:pos + 2])
+        extended = -length if length < 0 else 0  # extended length bytes
+        await self._fill(2 + extended + (4 if has_mask else 0))
+        pos = self._rstart + 2
+        if extended:
+            length = int.from_bytes(buf[pos:pos + extended], 'big')
+            pos += extended
+        max_allowed_length = self._max_allowed_length()
+        if max_allowed_length and length > max_allowed_length:
             raise WebSocketError('Message too large')
+        mask = None
         if has_mask:  # pragma: no cover
-            mask = await self.request.sock[0].read(4)
-        payload = await self.request.sock[0].read(length)
-        if has_mask:  # pragma: no cover
-            payload = bytes(x ^ mask[i % 4] for i, x in enumerate(payload))
-        return opcode, payload
+            mask = buf[pos:pos + 4]
+            pos += 4
+        self._rstart = pos
+
+        if length <= len(buf):
+            # the payload is read into the receive buffer
+            await self._fill(length)
+            start = self._rstart
+            end = start + length
+            self._rstart = end
+            if mask and _micropython:  # pragma: no cover
+                _unmask_inplace(buf, mask, start, end)
+                mask = None
+            payload = memoryview(buf)[start:end]
+        else:
+            # the payload is too large for the receive buffer, so the
+            # buffered part is completed with an exact read from the socket
+            buffered = bytes(buf[self._rstart:self._rend])
+            self._rstart = self._rend
+            payload = buffered + await self._read(
+                self.request.sock[0].readexactly, length - len(buffered))
+        if mask:  # pragma: no cover
+            return fin, opcode, _unmask(payload, mask), compressed
+        return fin, opcode, bytes(payload), compressed
+
+
+def _immutable(data):
+    # return the data as bytes or str, copying a bytearray or memoryview
+    if isinstance(data, (bytes, str)):
+        return data
+    return bytes(data)
+
+
+class WebSocketHub:
+    """Send the same message to a group of websocket connections.
+
+    Messages published to the hub are serialized and encoded into a frame
+    once, and the same frame is then written to every subscribed
+    connection. Connections are removed from the hub when they are closed,
+    or when writing to them fails. Connections that negotiated compression
+    have the message compressed separately, as each one has its own
+    compression context.
+
+    Example::
+
+        temperature_hub = WebSocketHub()
+
+        @app.route('/temperature')
+        @with_websocket
+        async def temperature(request, ws):
+            temperature_hub.subscribe(ws)
+            while True:
+                await ws.receive()
+
+        async def sampler():
+            while True:
+                await temperature_hub.publish({'tempC': read_temp_c()})
+                await asyncio.sleep(1)
+    """
+    def __init__(self):
+        #: The list of subscribed websocket connections.
+        self.subscribers = []
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def subscribe(self, ws):
+        """Add a websocket connection to the hub. The connection is removed
+        automatically when it is closed.
+
+        :param ws: The websocket connection.
+        """
+        if ws not in self.subscribers:
+            self.subscribers.append(ws)
+            ws._hubs.append(self)
+
+    def unsubscribe(self, ws):
+        """Remove a websocket connection from the hub.
+
+        :param ws: The websocket connection.
+        """
+        if ws in self.subscribers:
+            self.subscribers.remove(ws)
+            ws._hubs.remove(self)
+
+    async def publish(self, data, opcode=None, droppable=True):
+        """Send a message to all the subscribed connections.
+
+        :param data: The message, given as a string, bytes, or a dictionary
+                     or list that is serialized to JSON.
+        :param opcode: A custom frame opcode to use. If not given, the opcode
+                       is ``TEXT`` or ``BINARY`` depending on the type of the
+                       data.
+        :param droppable: Set to ``False`` for a message that must reach every
+                          connection even when their send queues drop
+                          messages. See :meth:`WebSocket.send`. A connection
+                          whose queue is full of messages that cannot be
+                          discarded is closed instead of making the other
+                          connections wait.
+        """
+        if not self.subscribers:
+            return
+        if isinstance(data, (dict, list)):
+            data = json.dumps(data)
+        opcode = opcode or (WebSocket.TEXT if isinstance(data, str)
+                            else WebSocket.BINARY)
+        if isinstance(data, str):
+            data = data.encode()
+        frame = None
+        for ws in self.subscribers[:]:
+            if ws.closed:
+                self.unsubscribe(ws)
+                continue
+            if not droppable and not ws._has_room():
+                # the client is not reading the messages it must get, and
+                # waiting for it would hold up every other connection, so it
+                # is disconnected
+                ws._disconnect()
+                continue
+            try:
+                if ws._deflater and len(data) >= ws.deflate_min_length:
+                    await ws.send(data, opcode, droppable=droppable)
+                else:
+                    if frame is None:
+                        frame = WebSocket._encode_websocket_frame(opcode,
+                                                                  data)
+                    await ws._send_frame(frame, droppable)
+            except Exception:
+                self.unsubscribe(ws)
+
+
+class _MessageStream:
+    # asynchronous iterator returned by WebSocket.receive_stream()
+    def __init__(self, ws):
+        self.ws = ws
+        self.opcode = None
+        self.done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.done:
+            raise StopAsyncIteration
+        fin, self.opcode, payload = await self.ws._read_data_frame()
+        self.done = bool(fin)
+        return payload
 
 
 async def websocket_upgrade(request):
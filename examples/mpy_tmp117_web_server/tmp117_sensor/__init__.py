@@ -0,0 +1,32 @@
+##
+# @file tmp117_sensor/__init__.py
+# @brief This Python file creates the temperature sensor that the web server talks to: a real TMP117 on the Qwiic bus,
+# or a simulated one so the server can run on any computer.
+#
+# @author SparkFun Electronics
+# @date October 2026
+# @copyright Copyright (c) 2024-2026, SparkFun Electronics Inc.
+#
+# SPDX-License-Identifier: MIT
+# @license MIT
+#
+
+from .temperature_sensor import TemperatureSensor, kConversionCycleMs
+from .simulated_tmp117 import SimulatedTMP117
+from .sensor_io import SensorIO, ThreadedSensorIO, create_sensor_io
+
+def create_sensor(simulate=False, address=None):
+    """
+    @brief Function to create the temperature sensor used by the web server
+
+    @param simulate Set to True to create a SimulatedTMP117 instead of talking to a real TMP117.
+    @param address The I2C address of the TMP117. None uses the default address.
+
+    @details
+    - The qwiic_tmp117 library is only imported for a real sensor, so it doesn't have to be installed to run simulated.
+    """
+    if simulate:
+        return SimulatedTMP117(address)
+
+    import qwiic_tmp117
+    return qwiic_tmp117.QwiicTMP117(address)
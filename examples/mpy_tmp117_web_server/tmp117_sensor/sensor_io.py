@@ -0,0 +1,76 @@
+##
+# @file sensor_io.py
+# @brief This Python file contains the ways the web server can run the blocking calls to its temperature sensor:
+# directly on the event loop, or on a worker thread so the event loop keeps serving clients during I2C transfers.
+#
+# @details
+# The qwiic libraries talk to the I2C bus with blocking calls. On a microcontroller a transfer takes a fraction of a
+# millisecond, but on Linux each one is a system call through the kernel's I2C driver, and a slow or stuck bus holds up
+# every request and websocket served by the event loop.
+# Both classes have the same run() coroutine, so the server awaits every sensor call the same way in both modes.
+#
+# @author SparkFun Electronics
+# @date October 2026
+# @copyright Copyright (c) 2024-2026, SparkFun Electronics Inc.
+#
+# SPDX-License-Identifier: MIT
+# @license MIT
+#
+
+import asyncio
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError: # MicroPython doesn't have threads that work with asyncio
+    ThreadPoolExecutor = None
+
+class SensorIO:
+    """
+    @brief Class that runs sensor calls directly, blocking the event loop until they return
+    """
+    async def run(self, func, *args):
+        """
+        @brief Call func with args and return its result
+
+        @param func The sensor method or function to call.
+        @param args The arguments to pass to it.
+        """
+        return func(*args)
+
+    def close(self):
+        """
+        @brief Stop running sensor calls
+        """
+        pass
+
+class ThreadedSensorIO(SensorIO):
+    """
+    @brief Class that runs sensor calls on a single worker thread, in the order they are made
+
+    @details
+    - The calls wait in the queue of a thread pool with one thread, so only one of them uses the bus at a time, like
+      when they all ran on the event loop. A coroutine that awaits run() lets the others run in the meantime.
+    - Only available on CPython.
+    """
+    def __init__(self):
+        """
+        @brief Constructor for the ThreadedSensorIO class, which starts the worker thread
+        """
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sensor_io")
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+def create_sensor_io(threaded=False):
+    """
+    @brief Function to create the object that runs the server's sensor calls
+
+    @param threaded Set to True to run them on a worker thread. This is ignored where threads aren't available, like
+    on MicroPython.
+    """
+    if threaded and ThreadPoolExecutor is not None:
+        return ThreadedSensorIO()
+    return SensorIO()
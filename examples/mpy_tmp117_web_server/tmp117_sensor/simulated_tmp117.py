@@ -0,0 +1,190 @@
+##
+# @file simulated_tmp117.py
+# @brief This Python file contains a simulated TMP117, so the web server, its websockets and its benchmarks can run
+# on a computer with no I2C bus.
+#
+# @details
+# The simulated sensor behaves like a TMP117 in continuous conversion mode, without any randomness: given the same
+# clock, it returns the same readings and flags every time.
+# - A conversion finishes every conversion cycle, with the cycle time set by the conversion cycle and averaging bits,
+#   starting from begin(). Changing either one restarts the conversions, like writing the configuration register does.
+# - The temperature follows a slow sine wave that crosses the default limits of the example, rounded to the 0.0078125
+#   degree resolution of the TMP117. The limits are rounded the same way. Sensors at different addresses are a quarter
+#   of a period apart, so they can be told apart.
+# - The data ready flag is set when a conversion finishes, and cleared when the configuration register or the
+#   temperature is read.
+# - In alert mode, the alert flags are set by any conversion past a limit, and cleared when the configuration register
+#   is read. In therm mode, the high alert flag is set above the high limit and cleared below the low limit.
+# - Each register read or write can be made to block for a while, like a transfer on a slow I2C bus.
+#
+# @author SparkFun Electronics
+# @date October 2026
+# @copyright Copyright (c) 2024-2026, SparkFun Electronics Inc.
+#
+# SPDX-License-Identifier: MIT
+# @license MIT
+#
+
+import math
+import time
+from microdot.helpers import ticks_ms, ticks_diff
+
+from .temperature_sensor import TemperatureSensor, kConversionCycleMs
+
+kResolution = 0.0078125 # Degrees Celsius per bit of the temperature and limit registers
+kMiddleC = 25.25 # Temperature in the middle of the simulated sine wave
+kSwingC = 1 # Degrees Celsius the simulated temperature swings above and below the middle
+kPeriodMs = 120000 # Milliseconds for the simulated temperature to go up and down once
+kMaxCatchUp = 64 # Most missed conversions checked against the limits when the sensor hasn't been read for a while
+
+def quantize(degreesC):
+    return round(degreesC / kResolution) * kResolution
+
+class SimulatedTMP117(TemperatureSensor):
+    """
+    @brief Class that simulates a TMP117 with the same methods as the QwiicTMP117 class
+    """
+    def __init__(self, address=None, clock=ticks_ms, transferMs=0):
+        """
+        @brief Constructor for the SimulatedTMP117 class
+
+        @param address The I2C address of the simulated sensor. It is only kept, so several sensors can be told apart.
+        @param clock A function that returns the time in milliseconds, like ticks_ms(). Pass a fake clock to control time.
+        @param transferMs The milliseconds each register read or write blocks for.
+        """
+        self.address = address
+        self.clock = clock
+        self.transferMs = transferMs
+        self.phaseMs = ((address or 0) & 0x3) * kPeriodMs // 4
+        # The values the TMP117 powers up with: 1 second cycles, limits at the ends of the range, alert mode
+        self.cycleBit = 4
+        self.averageMode = 1
+        self.lowLimit = -256.0
+        self.highLimit = 192.0
+        self.alertMode = self.kAlertMode
+        self.started = None
+        self.lastChecked = -1 # The latest conversion checked against the limits
+        self.lastRead = -1 # The latest conversion whose data ready flag was cleared
+        self.lowAlert = False
+        self.highAlert = False
+
+    def cycle_ms(self):
+        """
+        @brief Return the time of one conversion cycle in milliseconds
+        """
+        return kConversionCycleMs[self.cycleBit][self.averageMode]
+
+    def temperature_at(self, conversion):
+        """
+        @brief Return the result of a conversion, numbered from 0 for the first one after the conversions started
+        """
+        finishedMs = (conversion + 1) * self.cycle_ms() + self.phaseMs
+        return quantize(kMiddleC + kSwingC * math.sin(2 * math.pi * finishedMs / kPeriodMs))
+
+    def _transfer(self):
+        if self.transferMs:
+            time.sleep(self.transferMs / 1000)
+
+    def _restart(self):
+        self.started = self.clock()
+        self.lastChecked = -1
+        self.lastRead = -1
+
+    def _latest(self):
+        """
+        @brief Return the number of the latest finished conversion, after checking the ones since the last call
+        against the limits, or -1 if none has finished
+        """
+        if self.started is None:
+            return -1
+        latest = int(ticks_diff(self.clock(), self.started) // self.cycle_ms()) - 1
+        for conversion in range(max(self.lastChecked + 1, latest - kMaxCatchUp + 1), latest + 1):
+            temperature = self.temperature_at(conversion)
+            if self.alertMode == self.kAlertMode:
+                self.highAlert = self.highAlert or temperature > self.highLimit
+                self.lowAlert = self.lowAlert or temperature < self.lowLimit
+            elif temperature > self.highLimit:
+                self.highAlert = True
+            elif temperature < self.lowLimit:
+                self.highAlert = False
+        self.lastChecked = max(self.lastChecked, latest)
+        return latest
+
+    def _read_config(self):
+        """
+        @brief Simulate reading the configuration register, returning the data ready and alert flags as they were
+        before the read cleared them
+        """
+        self._transfer()
+        latest = self._latest()
+        flags = (latest > self.lastRead, self.lowAlert, self.highAlert)
+        self.lastRead = latest
+        if self.alertMode == self.kAlertMode:
+            self.lowAlert = self.highAlert = False
+        return flags
+
+    def is_connected(self):
+        return True
+
+    def begin(self):
+        self._restart()
+        return True
+
+    def data_ready(self):
+        return self._read_config()[0]
+
+    def read_temp_c(self):
+        self._transfer()
+        latest = self._latest()
+        self.lastRead = latest
+        return self.temperature_at(max(latest, 0))
+
+    def read_temp_f(self):
+        return self.read_temp_c() * 9 / 5 + 32
+
+    def set_low_limit(self, lowLimit):
+        self._transfer()
+        self.lowLimit = quantize(lowLimit)
+
+    def set_high_limit(self, highLimit):
+        self._transfer()
+        self.highLimit = quantize(highLimit)
+
+    def get_low_limit(self):
+        self._transfer()
+        return self.lowLimit
+
+    def get_high_limit(self):
+        self._transfer()
+        return self.highLimit
+
+    def set_alert_function_mode(self, setAlertMode):
+        self._transfer()
+        self.alertMode = setAlertMode
+
+    def get_high_low_alert(self):
+        flags = self._read_config()
+        alerts = [0, 0]
+        alerts[self.kLowAlertIdx] = int(flags[1])
+        alerts[self.kHighAlertIdx] = int(flags[2])
+        return alerts
+
+    def set_conversion_cycle_bit(self, convTime):
+        self._transfer()
+        self.cycleBit = convTime
+        if self.started is not None:
+            self._restart()
+
+    def get_conversion_cycle_bit(self):
+        self._transfer()
+        return self.cycleBit
+
+    def set_conversion_average_mode(self, convMode):
+        self._transfer()
+        self.averageMode = convMode
+        if self.started is not None:
+            self._restart()
+
+    def get_conversion_average_mode(self):
+        self._transfer()
+        return self.averageMode
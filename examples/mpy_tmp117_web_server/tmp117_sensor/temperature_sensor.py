@@ -0,0 +1,127 @@
+##
+# @file temperature_sensor.py
+# @brief This Python file describes the interface that the web server uses to talk to its temperature sensor.
+#
+# @details
+# The interface is the part of the QwiicTMP117 class from the qwiic_tmp117 library that the server uses, with the same
+# method names, so a QwiicTMP117 object can be used as it is. Other sensors, like SimulatedTMP117, subclass
+# TemperatureSensor and implement every method.
+#
+# @author SparkFun Electronics
+# @date October 2026
+# @copyright Copyright (c) 2024-2026, SparkFun Electronics Inc.
+#
+# SPDX-License-Identifier: MIT
+# @license MIT
+#
+
+# Milliseconds the TMP117 takes for one conversion cycle, indexed by the conversion cycle bits and then the averaging mode
+# (see table 7-7 of the TMP117 datasheet). Averaging makes a conversion take longer than the shortest cycle times
+kConversionCycleMs = [
+    [15.5, 125, 500, 1000],
+    [125, 125, 500, 1000],
+    [250, 250, 500, 1000],
+    [500, 500, 500, 1000],
+    [1000, 1000, 1000, 1000],
+    [4000, 4000, 4000, 4000],
+    [8000, 8000, 8000, 8000],
+    [16000, 16000, 16000, 16000],
+]
+
+class TemperatureSensor:
+    """
+    @brief Class that lists the methods a temperature sensor needs for the web server to use it
+
+    @details
+    - All temperatures are in degrees Celsius, except for read_temp_f().
+    - Like on the TMP117, reading the configuration register (data_ready() and get_high_low_alert()) or the temperature
+      clears the data ready flag.
+    """
+    kAlertMode = 0 # The alert flags latch when a conversion is past a limit, until they are read
+    kThermMode = 1 # The high alert flag is set above the high limit and cleared below the low limit
+    kLowAlertIdx = 0 # Index of the low alert flag in the list returned by get_high_low_alert()
+    kHighAlertIdx = 1 # Index of the high alert flag in the list returned by get_high_low_alert()
+
+    def is_connected(self):
+        """
+        @brief Return True if the sensor answers on the bus
+        """
+        raise NotImplementedError
+
+    def begin(self):
+        """
+        @brief Initialize the sensor and start converting
+        """
+        raise NotImplementedError
+
+    def data_ready(self):
+        """
+        @brief Return True if a conversion has finished since the temperature was last read
+        """
+        raise NotImplementedError
+
+    def read_temp_c(self):
+        """
+        @brief Return the result of the latest conversion in degrees Celsius
+        """
+        raise NotImplementedError
+
+    def read_temp_f(self):
+        """
+        @brief Return the result of the latest conversion in degrees Fahrenheit
+        """
+        raise NotImplementedError
+
+    def set_low_limit(self, lowLimit):
+        """
+        @brief Set the low temperature limit
+
+        @param lowLimit The limit in degrees Celsius.
+        """
+        raise NotImplementedError
+
+    def set_high_limit(self, highLimit):
+        """
+        @brief Set the high temperature limit
+
+        @param highLimit The limit in degrees Celsius.
+        """
+        raise NotImplementedError
+
+    def get_low_limit(self):
+        """
+        @brief Return the low temperature limit, as stored by the sensor
+        """
+        raise NotImplementedError
+
+    def get_high_limit(self):
+        """
+        @brief Return the high temperature limit, as stored by the sensor
+        """
+        raise NotImplementedError
+
+    def set_alert_function_mode(self, setAlertMode):
+        """
+        @brief Choose how the alert flags follow the limits
+
+        @param setAlertMode kAlertMode or kThermMode.
+        """
+        raise NotImplementedError
+
+    def get_high_low_alert(self):
+        """
+        @brief Return the alert flags as a list, indexed by kLowAlertIdx and kHighAlertIdx
+        """
+        raise NotImplementedError
+
+    def get_conversion_cycle_bit(self):
+        """
+        @brief Return the conversion cycle bits, the first index of kConversionCycleMs
+        """
+        raise NotImplementedError
+
+    def get_conversion_average_mode(self):
+        """
+        @brief Return the averaging mode, the second index of kConversionCycleMs
+        """
+        raise NotImplementedError
@@ -6,7 +6,7 @@
 # The complementary client code that is served can be found in the static directory.
 # 
 # @details
-# This module depends on the qwicc_tmp117 library to control the TMP117 sensor.
+# This module depends on the qwicc_tmp117 library to control the TMP117 sensor, unless kSimulateSensor is set.
 #
 # @note This code is designed to work with the qwiic_tmp117 library and a compatible microcontroller, such as the
 # SparkFun IoT RedBoard - ESP32, or the SparkFun IoT RedBoard - RP2350
@@ -20,25 +20,92 @@
 #
 
 # -------------------- Import the necessary modules -------------------- 
-from microdot import Microdot, send_file
-from microdot.websocket import with_websocket
+from microdot import Microdot, Request
+from microdot.websocket import WebSocket, WebSocketHub, with_websocket
+from microdot.ratelimit import RateLimiter
+from microdot.static import StaticFiles
+from microdot.accesslog import AccessLog
+from microdot.helpers import ticks_ms, ticks_diff, ticks_add
 import json
+import struct
+import array
 import asyncio
 import wlan_ap
-import qwiic_tmp117
+from tmp117_sensor import create_sensor, create_sensor_io, kConversionCycleMs
 
 # -------------------- Constants -------------------- 
-kDoAlerts = True # Set to False to disable checking alerts. This will speed up temperature reads.
+kDoAlerts = True # Set to False to disable the high and low temperature limits and alerts
+kSimulateSensor = False # Set to True to run on any computer without a TMP117: the sensor is simulated and the access point isn't set up
+kSensorAddresses = [0x48] # I2C addresses of the TMP117s to read. Each one can be set to 0x48, 0x49, 0x4A or 0x4B, so up to four share the bus. Readings are tagged with the position of their sensor in this list
+kSensorThread = True # Read and write the TMP117 on a worker thread, so slow I2C transfers never hold up the web server. Only used on CPython (Raspberry Pi)
 kApSsid = "iot_redboard_tmp117" # This will be the SSID of the AP, the "Network Name" that you'll see when you scan for networks on your client device
 kApPass = "thermo_wave2" # This will be the password for the AP, that you'll use when you connect to the network from your client device
+kRateLimit = 5 # Requests per second that each client can make to the server. Clients polling faster than this get a "429 Too Many Requests" response
+kRateBurst = 10 # Requests that a client can make in a quick burst, for example when the page and its static files are first loaded
+kRateKeyHeader = None # Header that holds the address of each client, like 'X-Forwarded-For', when the server runs behind a reverse proxy. None tells the clients apart by the address they connect from
+kStaticCacheSize = 16 * 1024 # Bytes of RAM used to keep the static web files in memory so they don't have to be read from flash on every request
+kAccessLog = False # Set to True to print a line to the console for every request handled by the server
+kIdleTimeout = 5 # Seconds a client can keep a connection open without sending a request before it is closed
+kRequestTimeout = 5 # Seconds a client can take to send the headers (and again for the body) of its request before it is closed
+kPingInterval = 10 # Seconds a websocket client can stay quiet before the server checks that it is still there with a ping
+kPingTimeout = 5 # Seconds a websocket client has to answer a ping before its connection is closed and its memory freed
+kBinaryProtocol = "tmp117.bin.v1" # Websocket subprotocol that clients can ask for to receive each reading as a small binary record instead of JSON
+kRecordVersion = 1 # First byte of every binary record, so the client can tell if the record layout changes
+kRecordFormat = "<BBIhhh" # Binary record layout: version, flags (alert bits and sensor ID), timestamp (ms), temperature, low limit, high limit (hundredths of a degree C)
+kBatchWindow = 0 # Milliseconds readings are collected for and then sent together as one message. 0 sends every reading on its own
+kBatchSize = 10 # Most readings sent in one message. A full batch is sent right away, without waiting for the window to end
+kSendQueueSize = 2 # Temperature messages that can be waiting to be sent to each websocket client before older ones are thrown away
+kPollsPerCycle = 16 # Times per conversion cycle the sampler checks the data ready flag once a conversion is due
+kMinPollMs = 2 # Shortest time in milliseconds between two checks of the data ready flag
+kHistorySize = 1800 # Readings kept in RAM for the /history route, 6 bytes each. At one reading per second this is the last 30 minutes
+kHistoryChunk = 32 # Readings formatted at a time when the history is sent, so a long history is never held in RAM as one string
+kHistoryTiers = [(10000, 360), (60000, 360), (900000, 96)] # (milliseconds, buckets) of each roll up of the history: an hour of 10 s buckets, 6 hours of 1 minute buckets and a day of 15 minute buckets, 12 bytes per bucket
+kLimitDebounceMs = 250 # Milliseconds new limits are collected for before they are written, so a burst of changes (like holding an arrow key in a limit box) only writes the last one
+kLimitRangeC = (-256, 255.99) # Lowest and highest limits in degrees Celsius that the TMP117 limit registers can hold. Limits outside this range are refused
+kLimitResolution = 0.0078125 # Degrees Celsius per bit of the TMP117 limit registers. A new limit that rounds to the one already set isn't written
 
 # -------------------- Shared Variables -------------------- 
-# Create instance of our TMP117 device
-myTMP117 = qwiic_tmp117.QwiicTMP117()
+# Every call to the TMP117 made while the server is running goes through here, so it can be run on a worker thread
+sensorIO = create_sensor_io(kSensorThread)
 
 # Use the Microdot framework to create a web server
 app = Microdot()
 
+# Don't let clients that open a connection and then send nothing (or trickle bytes) hold on to one of our few sockets
+Request.idle_timeout = kIdleTimeout
+Request.header_timeout = kRequestTimeout
+Request.body_timeout = kRequestTimeout
+
+# Compress the temperature messages when the browser supports it. Each message is almost identical to the one before it,
+# so with the compression context kept between messages they shrink to a fraction of their size (only available on CPython)
+WebSocket.permessage_deflate = True
+
+# Give each websocket client its own small send queue. A phone that walks out of WiFi range stops reading, but the
+# server keeps going and the client only gets the newest reading when it catches up, since old temperatures are useless
+WebSocket.send_queue_size = kSendQueueSize
+WebSocket.send_queue_policy = WebSocket.KEEP_LATEST
+
+# A client that drops off the access point never says goodbye, so ping quiet clients and close the ones that don't answer
+WebSocket.ping_interval = kPingInterval
+WebSocket.ping_timeout = kPingTimeout
+
+# Let clients choose the binary record format when they open the websocket. Clients that don't ask for it get JSON
+WebSocket.subprotocols = [kBinaryProtocol]
+
+# Make sure a single client polling the server in a tight loop can't starve everyone else
+rateLimiter = RateLimiter(app, rate=kRateLimit, burst=kRateBurst, key_header=kRateKeyHeader)
+
+# Serve everything in the "static" directory under the /static path, keeping the small files in RAM
+staticFiles = StaticFiles(app, 'static', url_prefix='/static', cache_size=kStaticCacheSize)
+
+# Every reading is published to all the connected clients through one of these hubs, depending on the format they asked for
+jsonHub = WebSocketHub()
+binaryHub = WebSocketHub()
+
+# The access log is written in batches by a background task, so a slow serial console doesn't hold up the server
+if kAccessLog:
+    accessLog = AccessLog(app)
+
 # -------------------- Fahrenheit to Celcius -------------------- 
 def f_to_c(degreesF):
     return (degreesF - 32) * 5/9
@@ -46,6 +113,638 @@ def f_to_c(degreesF):
 def c_to_f(degreesC):
     return (degreesC * 9/5) + 32
 
+# -------------------- Temperature Limits -------------------- 
+class LimitCache:
+    """
+    @brief Class that keeps a copy of the high and low limits written to the TMP117, and works out the alerts from them
+
+    @details
+    - The limits only change when a client sends new ones, so they are read from the TMP117 once when they are written,
+      instead of on every reading.
+    - The alert flags are worked out from each temperature reading the same way the TMP117 sets them in alert mode:
+      the high alert when the temperature is above the high limit, and the low alert when it is below the low limit.
+      Reading the flags from the TMP117 would mean waiting between reads of its configuration register, and reading it
+      also clears the data ready flag.
+    """
+    def __init__(self, tmp117Device):
+        """
+        @brief Constructor for the LimitCache class
+
+        @param tmp117Device The QwiicTMP117 object the limits are written to.
+        """
+        self.device = tmp117Device
+        self.lowC = None
+        self.highC = None
+
+    def load(self):
+        """
+        @brief Read the limits from the TMP117, for example after it has been configured
+        """
+        self.lowC = self.device.get_low_limit()
+        self.highC = self.device.get_high_limit()
+
+    def set_low(self, degreesC):
+        """
+        @brief Write a new low limit to the TMP117 and return the limit it stored, which is rounded to its resolution
+
+        @param degreesC The new low limit in degrees Celsius.
+        """
+        self.device.set_low_limit(degreesC)
+        self.lowC = self.device.get_low_limit()
+        return self.lowC
+
+    def set_high(self, degreesC):
+        """
+        @brief Write a new high limit to the TMP117 and return the limit it stored, which is rounded to its resolution
+
+        @param degreesC The new high limit in degrees Celsius.
+        """
+        self.device.set_high_limit(degreesC)
+        self.highC = self.device.get_high_limit()
+        return self.highC
+
+    def alerts(self, tempC):
+        """
+        @brief Return the low and high alert flags for a temperature, as a (low, high) tuple
+
+        @param tempC The temperature in degrees Celsius.
+        """
+        return tempC < self.lowC, tempC > self.highC
+
+# -------------------- Binary Telemetry -------------------- 
+def pack_reading(timestamp, data):
+    """
+    @brief Function to pack a temperature reading into the compact binary record sent to kBinaryProtocol clients
+
+    @param timestamp The time the reading was taken, from ticks_ms().
+    @param data The reading, as the dictionary that is sent to JSON clients.
+
+    @details
+    - The record is 12 bytes, packed little-endian with kRecordFormat, instead of about 100 bytes of JSON.
+    - Temperatures are stored in hundredths of a degree Celsius, which is finer than the resolution of the TMP117 (0.0078 C)
+    - Bit 0 of the flags is the low alert and bit 1 is the high alert. Bits 4 to 7 are the ID of the sensor that took
+      the reading, which is 0 when there is only one.
+    - The timestamp is in milliseconds since the board started, so the client can tell how old the reading is.
+    """
+    flags = (1 if data['alertL'] else 0) | (2 if data['alertH'] else 0) | (data['sensor'] << 4)
+    return struct.pack(kRecordFormat, kRecordVersion, flags, timestamp & 0xFFFFFFFF,
+                       round(data['tempC'] * 100), round(f_to_c(data['limitL']) * 100), round(f_to_c(data['limitH']) * 100))
+
+# -------------------- Batching Readings -------------------- 
+class ReadingBatch:
+    """
+    @brief Class that collects readings so that they can be sent to the clients together in one websocket message
+
+    @details
+    - At high sample rates, sending one message per reading costs more in frame headers and socket writes than the reading itself.
+    - A batch is ready to send when it holds maxReadings readings, or when its oldest reading is windowMs old, so a reading is
+      never delayed by more than windowMs.
+    """
+    def __init__(self, windowMs, maxReadings):
+        """
+        @brief Constructor for the ReadingBatch class
+
+        @param windowMs The longest time in milliseconds that a reading waits in the batch before it is sent.
+        @param maxReadings The most readings sent in one message.
+        """
+        self.windowMs = windowMs
+        self.maxReadings = maxReadings
+        self.readings = []
+        self.started = 0
+
+    def add(self, reading):
+        """
+        @brief Add a reading to the batch
+
+        @param reading The reading, as a (timestamp, data) tuple.
+        """
+        if not self.readings:
+            self.started = ticks_ms()
+        self.readings.append(reading)
+
+    def time_left(self):
+        """
+        @brief Return the number of milliseconds until the batch has to be sent, or None if the batch is empty
+        """
+        if not self.readings:
+            return None
+        if len(self.readings) >= self.maxReadings:
+            return 0
+        return max(0, self.windowMs - ticks_diff(ticks_ms(), self.started))
+
+    def take(self):
+        """
+        @brief Remove and return all the readings in the batch, oldest first
+        """
+        readings = self.readings
+        self.readings = []
+        return readings
+
+async def publish_readings(readings):
+    """
+    @brief Function to send a batch of readings to all the connected clients, each in the format it asked for
+
+    @param readings The list of (timestamp, data) readings to send, oldest first.
+
+    @details
+    - Each message is encoded once, and the same websocket frame is written to every client in the hub.
+    - Binary records are simply joined, since they all have the same size.
+    - JSON readings are sent as an array, or as a single object when batching is disabled, like before batching existed.
+    """
+    if len(binaryHub):
+        await binaryHub.publish(b"".join([pack_reading(timestamp, data) for timestamp, data in readings]))
+    if len(jsonHub):
+        if kBatchWindow <= 0:
+            await jsonHub.publish(readings[0][1])
+        else:
+            await jsonHub.publish([data for timestamp, data in readings])
+
+# -------------------- Reading History -------------------- 
+def find_after(timestamps, first, end, capacity, since):
+    """
+    @brief Function to find the first entry of a ring buffer with a timestamp after since
+
+    @param timestamps The array of timestamps of the ring buffer, in time order by sequence number.
+    @param first The sequence number of the oldest entry to search.
+    @param end The sequence number after the newest entry to search.
+    @param capacity The number of entries the ring buffer holds.
+    @param since The ticks_ms() timestamp to search for.
+
+    @details
+    - Entries are in time order, so a binary search skips the old ones without looking at each of them.
+    - Returns end if no entry is after since.
+    """
+    since &= 0xFFFFFFFF
+    while first < end:
+        middle = (first + end) // 2
+        if ticks_diff(timestamps[middle % capacity], since) > 0:
+            end = middle
+        else:
+            first = middle + 1
+    return first
+
+def stream_json(rows, prefix="[", suffix="]"):
+    """
+    @brief Generator that joins rows of JSON text into a JSON array, kHistoryChunk rows at a time
+
+    @param rows An iterable of rows, each already formatted as JSON.
+    @param prefix The text sent before the rows.
+    @param suffix The text sent after the rows.
+
+    @details
+    - The response sends each chunk before the next one is formatted, so a long history is never held in RAM as one string.
+    """
+    yield prefix
+    chunk = []
+    separator = ""
+    for row in rows:
+        chunk.append(separator + row)
+        separator = ","
+        if len(chunk) >= kHistoryChunk:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+    yield suffix
+
+class HistoryTier:
+    """
+    @brief Class that rolls readings up into buckets of a fixed length of time, keeping the min, max, mean and count of
+    the readings in each bucket
+
+    @details
+    - Buckets start on a multiple of their length, so every client sees the same buckets.
+    - The bucket being filled is updated as each reading arrives, and is moved into a ring buffer of arrays when a reading
+      falls past its end. Nothing is ever computed again from the raw readings.
+    - Each stored bucket takes 12 bytes: a 32 bit start time, and the min, max, mean and count as 16 bit numbers.
+    - Start times wrap around with ticks_ms() and are only compared with ticks_diff(), so buckets keep closing after the
+      wrap. The bucket that spans it starts where it would have without the wrap, so only the first bucket after it is
+      shorter.
+    """
+    def __init__(self, resolutionMs, capacity):
+        """
+        @brief Constructor for the HistoryTier class
+
+        @param resolutionMs The length of each bucket in milliseconds.
+        @param capacity The number of buckets kept.
+        """
+        self.resolutionMs = resolutionMs
+        self.capacity = capacity
+        self.starts = array.array('I', bytes(4 * capacity))
+        self.lows = array.array('h', bytes(2 * capacity))
+        self.highs = array.array('h', bytes(2 * capacity))
+        self.means = array.array('h', bytes(2 * capacity))
+        self.counts = array.array('H', bytes(2 * capacity))
+        self.count = 0 # Buckets stored since the start, the sequence number of the next bucket
+        # The bucket being filled
+        self.start = 0
+        self.low = 0
+        self.high = 0
+        self.total = 0
+        self.readings = 0
+
+    def add(self, timestamp, temperature):
+        """
+        @brief Add a reading to the bucket being filled, storing that bucket first if the reading is past its end
+
+        @param timestamp The time the reading was taken, from ticks_ms().
+        @param temperature The temperature in hundredths of a degree Celsius.
+        """
+        if self.readings and ticks_diff(timestamp, self.start) >= self.resolutionMs:
+            index = self.count % self.capacity
+            self.starts[index] = self.start
+            self.lows[index] = self.low
+            self.highs[index] = self.high
+            self.means[index] = round(self.total / self.readings)
+            self.counts[index] = min(self.readings, 0xFFFF)
+            self.count += 1
+            self.readings = 0
+        if not self.readings:
+            self.start = timestamp - timestamp % self.resolutionMs
+            self.low = self.high = temperature
+            self.total = 0
+        self.low = min(self.low, temperature)
+        self.high = max(self.high, temperature)
+        self.total += temperature
+        self.readings += 1
+
+    def find(self, since=None, limit=None):
+        """
+        @brief Return the range of sequence numbers of the stored buckets that match a query, and whether the bucket being
+        filled matches too, as a (first, end, filling) tuple
+
+        @param since Only buckets that end after this ticks_ms() timestamp are included. None includes all of them.
+        @param limit The most buckets included, counting the one being filled. When more match, the newest are included.
+        """
+        filling = self.readings > 0 and (limit is None or limit > 0) and \
+            (since is None or ticks_diff(self.start + self.resolutionMs, since & 0xFFFFFFFF) > 0)
+        first = max(0, self.count - self.capacity)
+        if since is not None:
+            first = find_after(self.starts, first, self.count, self.capacity, since - self.resolutionMs)
+        if limit is not None:
+            first = max(first, self.count - max(0, limit - (1 if filling else 0)))
+        return first, self.count, filling
+
+    def rows(self, first, end, filling):
+        """
+        @brief Generator that formats a range of buckets, and then the bucket being filled, as JSON arrays of
+        [start, min, max, mean, count], with the temperatures in degrees Celsius
+
+        @param first The sequence number of the first bucket, as returned by find().
+        @param end The sequence number after the last bucket.
+        @param filling Whether to include the bucket being filled, as returned by find().
+        """
+        # Take a copy of the bucket being filled now, because it may be stored while the response is being sent
+        current = (self.start, self.low, self.high, self.total, self.readings)
+        for sequence in range(first, end):
+            if sequence < self.count - self.capacity:
+                continue # It was replaced while the response was being sent
+            index = sequence % self.capacity
+            yield "[{},{},{},{},{}]".format(self.starts[index], self.lows[index] / 100, self.highs[index] / 100,
+                                            self.means[index] / 100, self.counts[index])
+        if filling and current[4]:
+            start, low, high, total, readings = current
+            yield "[{},{},{},{},{}]".format(start, low / 100, high / 100, round(total / readings) / 100, readings)
+
+class ReadingHistory:
+    """
+    @brief Class that keeps the most recent readings in a fixed size ring buffer, so a client that connects late can
+    fetch what it missed, along with HistoryTier roll ups of them for longer time ranges
+
+    @details
+    - Timestamps and temperatures are stored in two arrays, the temperatures in hundredths of a degree Celsius like in the
+      binary records, so each reading takes 6 bytes instead of a dictionary of a few hundred bytes.
+    - The arrays are allocated once, at their full size. When the buffer is full, each new reading replaces the oldest one.
+    - Every reading gets a sequence number, which counts up forever. A reading is still in the buffer as long as its
+      sequence number is at most capacity less than the count, so readers can tell when one has been replaced.
+    """
+    def __init__(self, capacity, tiers):
+        """
+        @brief Constructor for the ReadingHistory class
+
+        @param capacity The number of readings kept.
+        @param tiers A list of (resolutionMs, capacity) tuples, one for each HistoryTier, from the finest to the coarsest.
+        """
+        self.capacity = capacity
+        self.timestamps = array.array('I', bytes(4 * capacity)) # Unsigned 32 bit, like the timestamps in the binary records
+        self.temperatures = array.array('h', bytes(2 * capacity))
+        self.count = 0 # Readings added since the start, the sequence number of the next reading
+        self.tiers = [HistoryTier(resolutionMs, tierCapacity) for resolutionMs, tierCapacity in tiers]
+        self.started = None # Timestamp of the first reading
+
+    def add(self, timestamp, tempC):
+        """
+        @brief Add a reading, replacing the oldest one if the buffer is full, and roll it up into every tier
+
+        @param timestamp The time the reading was taken, from ticks_ms().
+        @param tempC The temperature in degrees Celsius.
+        """
+        timestamp &= 0xFFFFFFFF
+        temperature = round(tempC * 100)
+        index = self.count % self.capacity
+        self.timestamps[index] = timestamp
+        self.temperatures[index] = temperature
+        self.count += 1
+        if self.started is None:
+            self.started = timestamp
+        for tier in self.tiers:
+            tier.add(timestamp, temperature)
+
+    def find(self, since=None, limit=None):
+        """
+        @brief Return the range of sequence numbers of the readings that match a query, as a (first, end) tuple
+
+        @param since Only readings taken after this ticks_ms() timestamp are included. None includes all of them.
+        @param limit The most readings included. When more match, the newest ones are included.
+        """
+        first = max(0, self.count - self.capacity)
+        if since is not None:
+            first = find_after(self.timestamps, first, self.count, self.capacity, since)
+        if limit is not None:
+            first = max(first, self.count - limit)
+        return first, self.count
+
+    def rows(self, first, end, summary=False):
+        """
+        @brief Generator that formats a range of readings as JSON arrays of [timestamp, tempC], oldest first
+
+        @param first The sequence number of the first reading, as returned by find().
+        @param end The sequence number after the last reading.
+        @param summary If True, each reading is formatted like a bucket of one reading, [timestamp, min, max, mean, 1].
+
+        @details
+        - New readings can arrive while the response is being sent. Readings that are replaced in the meantime are
+          left out, so the response never mixes old and new values.
+        """
+        for sequence in range(first, end):
+            if sequence < self.count - self.capacity:
+                continue # It was replaced while the response was being sent
+            index = sequence % self.capacity
+            tempC = self.temperatures[index] / 100
+            if summary:
+                yield "[{},{},{},{},1]".format(self.timestamps[index], tempC, tempC, tempC)
+            else:
+                yield "[{},{}]".format(self.timestamps[index], tempC)
+
+    def pick_tier(self, since, points):
+        """
+        @brief Return the coarsest tier that still has at least the requested number of buckets for a time range, or None
+        if only the raw readings are fine enough
+
+        @param since The start of the time range, as a ticks_ms() timestamp. None means since the first reading.
+        @param points The number of points the client wants to draw.
+        """
+        if self.started is None:
+            return None
+        spanMs = ticks_diff(ticks_ms() & 0xFFFFFFFF, self.started if since is None else since & 0xFFFFFFFF)
+        for tier in reversed(self.tiers):
+            if tier.resolutionMs * points <= spanMs:
+                return tier
+        return None
+
+# -------------------- Sensors -------------------- 
+class MonitoredSensor:
+    """
+    @brief Class that holds everything the server keeps for one TMP117: the device, its limits, the history of its
+    readings, and the numbers reported at the /sensors route
+
+    @details
+    - Each sensor keeps its own conversion schedule, so sample_temperature() can read several of them, each when its own
+      conversion is due.
+    - Every call to the device is awaited through sensorIO, so on CPython the I2C transfers happen on a worker thread.
+    """
+    def __init__(self, sensorId, address, device):
+        """
+        @brief Constructor for the MonitoredSensor class
+
+        @param sensorId The number the readings of this sensor are tagged with.
+        @param address The I2C address of the TMP117.
+        @param device The QwiicTMP117 object, or an object with the same methods like SimulatedTMP117.
+        """
+        self.sensorId = sensorId
+        self.address = address
+        self.device = device
+        # The limits are kept here when they are written, so they don't have to be read back from the TMP117 on every reading
+        self.limits = LimitCache(device)
+        # The readings of the last kHistorySize conversions, and their roll ups
+        self.history = ReadingHistory(kHistorySize, kHistoryTiers)
+        self.cycleMs = 1000
+        self.pollMs = kMinPollMs
+        self.nextCheck = 0 # When to check the data ready flag next, from ticks_ms()
+        self.readings = 0 # Readings taken since the start
+        self.errors = 0 # Reads of the TMP117 that failed, for example with an I2C error
+        self.started = False # Whether start() has succeeded
+        self.latest = None # The latest (timestamp, data) reading
+
+    async def start(self):
+        """
+        @brief Read the conversion cycle and the limits of the TMP117, before its first reading
+        """
+        self.cycleMs = await sensorIO.run(conversion_cycle_ms, self.device)
+        self.pollMs = max(kMinPollMs, int(self.cycleMs) // kPollsPerCycle)
+        self.nextCheck = ticks_ms()
+        if kDoAlerts:
+            await sensorIO.run(self.limits.load)
+        self.started = True
+
+    async def poll(self):
+        """
+        @brief Read the TMP117 if its conversion has finished, and work out when to check it next
+
+        @details
+        - Returns the reading as a (timestamp, data) tuple, or None if the conversion isn't quite finished.
+        """
+        if not await sensorIO.run(self.device.data_ready):
+            # The conversion isn't quite finished, check again shortly
+            self.nextCheck = ticks_add(ticks_ms(), self.pollMs)
+            return None
+
+        # We'll store all our results in a dictionary so it's easy to dump to JSON
+        data = {"sensor": self.sensorId, "tempF": 0, "tempC": 0, "limitH": 75, "limitL": 65, "alertH": False, "alertL": False}
+        timestamp = ticks_ms()
+        data['tempC'] = await sensorIO.run(self.device.read_temp_c)
+        data['tempF'] = c_to_f(data['tempC']) # Worked out here instead of reading the temperature register again
+
+        if kDoAlerts:
+            # The limits and alerts come from the cache, so there's no need to read the TMP117 again
+            data['alertL'], data['alertH'] = self.limits.alerts(data['tempC'])
+            data['limitL'] = c_to_f(self.limits.lowC)
+            data['limitH'] = c_to_f(self.limits.highC)
+
+        # The next conversion finishes one cycle after this one was noticed. Start checking one poll early, since this
+        # one may have finished up to a poll before we noticed it
+        self.nextCheck = ticks_add(timestamp, int(self.cycleMs) - self.pollMs)
+        return timestamp, data
+
+    def record(self, timestamp, data):
+        """
+        @brief Add a reading to the history and the numbers of this sensor
+
+        @param timestamp The time the reading was taken, from ticks_ms().
+        @param data The reading, as the dictionary that is sent to JSON clients.
+        """
+        self.history.add(timestamp, data['tempC'])
+        self.readings += 1
+        self.latest = (timestamp, data)
+
+    def status(self):
+        """
+        @brief Return the numbers of this sensor as a dictionary, for the /sensors route
+        """
+        status = {"sensor": self.sensorId, "address": self.address, "cycleMs": self.cycleMs, "readings": self.readings,
+                  "errors": self.errors}
+        if self.latest is not None:
+            status["timestamp"] = self.latest[0]
+            status["tempC"] = self.latest[1]['tempC']
+        return status
+
+# Create instance of each of our TMP117 devices, or of simulated ones that behave the same way
+sensors = [MonitoredSensor(sensorId, address, create_sensor(kSimulateSensor, address))
+           for sensorId, address in enumerate(kSensorAddresses)]
+
+def find_sensor(sensorId):
+    """
+    @brief Function to return the MonitoredSensor with the given ID, or None if there isn't one
+
+    @param sensorId The ID sent by the client, which may not be a number.
+    """
+    if isinstance(sensorId, int) and not isinstance(sensorId, bool) and 0 <= sensorId < len(sensors):
+        return sensors[sensorId]
+    return None
+
+# -------------------- Limit Updates -------------------- 
+def parse_limit(degreesF):
+    """
+    @brief Function to check a limit sent by a client, and return it in degrees Celsius, or None if it isn't valid
+
+    @param degreesF The limit in degrees Fahrenheit, as decoded from the client's JSON message.
+    """
+    if isinstance(degreesF, bool) or not isinstance(degreesF, (int, float)):
+        return None
+    degreesC = f_to_c(degreesF)
+    # NaN fails both comparisons, and infinity is outside the range, so only real temperatures get through
+    if not (kLimitRangeC[0] <= degreesC <= kLimitRangeC[1]):
+        return None
+    return degreesC
+
+async def publish_limits(updated, errors):
+    """
+    @brief Function to confirm the limits of some sensors to all the connected clients in one message
+
+    @param updated The list of MonitoredSensor objects whose limits were just updated.
+    @param errors A list of {"sensor": 0, "limit": "low", "error": "..."} entries for the limits that couldn't be written.
+
+    @details
+    - The message is a JSON object, {"limits": [{"sensor": 0, "limitL": 65.0, "limitH": 75.0}, ...]}, with the limits
+      in degrees Fahrenheit as stored by the TMP117, and an "errors" list when any write failed. It is sent as text to
+      the clients of both hubs, so binary clients can tell it apart from their records.
+    - It is never dropped by the send queues like old readings are, so every client gets it even when it is behind.
+    """
+    confirmation = {"limits": [{"sensor": sensor.sensorId,
+                                "limitL": None if sensor.limits.lowC is None else c_to_f(sensor.limits.lowC),
+                                "limitH": None if sensor.limits.highC is None else c_to_f(sensor.limits.highC)}
+                               for sensor in updated]}
+    if errors:
+        confirmation["errors"] = errors
+    message = json.dumps(confirmation)
+    for hub in (jsonHub, binaryHub):
+        if len(hub):
+            await hub.publish(message, droppable=False)
+
+class LimitUpdater:
+    """
+    @brief Class that collects the new limits sent by the clients and writes them to the TMP117s in the background
+
+    @details
+    - The first new limit starts a window of windowMs milliseconds. Every limit that arrives during the window replaces
+      the one waiting for the same sensor and limit, so only the last value of a burst is written.
+    - When the window ends, each waiting limit is only written if it is different from the one the TMP117 already
+      holds, after rounding to its resolution. The limits of every sensor that was sent one are then confirmed to every
+      client in one message.
+    - The writes are done by a background task, started the first time it is needed, so the websocket handlers never
+      wait for the I2C bus. A write that fails, for example with an I2C error, is reported in the confirmation and the
+      task carries on with the next one.
+    """
+    def __init__(self, windowMs):
+        """
+        @brief Constructor for the LimitUpdater class
+
+        @param windowMs The milliseconds new limits are collected for before they are written.
+        """
+        self.windowMs = windowMs
+        self.pending = {} # The limits waiting to be written in degrees Celsius, keyed by (sensor, "low" or "high")
+        self.wakeup = None # Created by the writer task, so it belongs to the running loop
+        self.task = None
+        self.writes = 0 # Limits written to a TMP117
+        self.coalesced = 0 # Limits replaced by a newer one before they were written
+        self.unchanged = 0 # Limits not written because the TMP117 already held them
+        self.failed = 0 # Limits that couldn't be written because of an error
+
+    def request(self, sensor, which, degreesC):
+        """
+        @brief Queue a new limit, to be written at the end of the current window
+
+        @param sensor The MonitoredSensor to set the limit of.
+        @param which "low" or "high".
+        @param degreesC The new limit in degrees Celsius.
+        """
+        key = (sensor, which)
+        if key in self.pending:
+            self.coalesced += 1
+        self.pending[key] = degreesC
+        if self.task is None:
+            self.task = asyncio.create_task(self.writer())
+        elif self.wakeup is not None:
+            self.wakeup.set()
+
+    async def write(self, sensor, which, degreesC):
+        """
+        @brief Write one limit to a TMP117 if it is different from the one already set, and return True if it was written
+        """
+        current = sensor.limits.lowC if which == "low" else sensor.limits.highC
+        if current is not None and round(degreesC / kLimitResolution) == round(current / kLimitResolution):
+            self.unchanged += 1
+            return False
+        setter = sensor.limits.set_low if which == "low" else sensor.limits.set_high
+        stored = await sensorIO.run(setter, degreesC)
+        self.writes += 1
+        print("New " + which + " limit of sensor " + str(sensor.sensorId) + ": " + str(stored))
+        return True
+
+    async def writer(self):
+        """
+        @brief Coroutine that waits for new limits, and writes them at the end of each window
+        """
+        self.wakeup = asyncio.Event()
+        try:
+            while True:
+                if not self.pending:
+                    await self.wakeup.wait()
+                await asyncio.sleep(self.windowMs / 1000)
+                self.wakeup.clear()
+                pending = self.pending
+                self.pending = {}
+                updated = []
+                errors = []
+                for (sensor, which), degreesC in pending.items():
+                    try:
+                        await self.write(sensor, which, degreesC)
+                    except Exception as exc:
+                        self.failed += 1
+                        print("Couldn't set the " + which + " limit of sensor " + str(sensor.sensorId) + ": " + repr(exc))
+                        errors.append({"sensor": sensor.sensorId, "limit": which, "error": repr(exc)})
+                    if sensor not in updated:
+                        updated.append(sensor)
+                # Confirm the limits even when they didn't change, so the client that sent them knows where they stand
+                await publish_limits(updated, errors)
+        finally:
+            # Let the next request start a new task if this one ever ends
+            self.task = None
+            self.wakeup = None
+
+# Every new limit sent by a client goes through here
+limitUpdater = LimitUpdater(kLimitDebounceMs)
+
 # --------------------  Set up the TMP117 -------------------- 
 def config_TMP117(tmp117Device, doAlerts):
     """
@@ -78,6 +777,23 @@ def config_TMP117(tmp117Device, doAlerts):
 
     print("TMP117 Configured!")
 
+def conversion_cycle_ms(tmp117Device):
+    """
+    @brief Function to find how often the TMP117 finishes a conversion
+
+    @param tmp117Device The QwiicTMP117 object to ask.
+
+    @details
+    - The cycle time is looked up in kConversionCycleMs from the conversion cycle and averaging bits of the configuration register.
+    - If the driver can't report them, the cycle time the TMP117 powers up with (1 second) is returned.
+    """
+    try:
+        cycleBit = tmp117Device.get_conversion_cycle_bit()
+        averageMode = tmp117Device.get_conversion_average_mode()
+    except AttributeError:
+        return 1000
+    return kConversionCycleMs[cycleBit][averageMode]
+
 # -------------------- Asynchronous Microdot Functions -------------------- 
 @app.route('/')
 async def index(request):
@@ -89,40 +805,170 @@ async def index(request):
     @details
     - This function is asynchronous and is called when a client requests the root "/" path from our server.
     - The requested file is located in the "static" directory.
-    - The requested file is sent to the client.
+    - The requested file is sent to the client, straight from RAM if it is in the static files cache.
+    """
+    return staticFiles.serve('index.html')
+
+@app.route('/history')
+async def get_history(request):
+    """
+    @brief Function/Route that sends the readings kept in the history as JSON
+
+    @param request The Microdot "Request" object containing details about a client HTTP request.
+
+    @details
+    - The "since" query parameter asks for the readings taken after a timestamp, for example the newest one the client
+      already has. The timestamps are the same ticks_ms() values as in the binary records.
+    - The "limit" query parameter caps the number of readings sent, keeping the newest ones.
+    - The "sensor" query parameter picks the sensor, by its position in kSensorAddresses. The default is the first one.
+    - Without "points", the readings are sent as an array of [timestamp, tempC] pairs.
+    - With "points", the client asks for enough data to draw that many points between "since" (or the first reading) and
+      now. The coarsest HistoryTier with at least that many buckets in the range is picked, and the response is an object
+      like {"resolutionMs": 60000, "rows": [[start, min, max, mean, count], ...]}. A resolution of 0 means the raw
+      readings were fine enough, each sent as a bucket of one.
+    - The response is streamed in chunks, so asking for the whole history doesn't need RAM for all of it at once.
     """
-    return send_file('static/index.html')
+    # request.args is a plain dictionary when there is no query string, so convert the values here
+    since = request.args.get('since')
+    limit = request.args.get('limit')
+    points = request.args.get('points')
+    sensorId = request.args.get('sensor', '0')
+    try:
+        since = int(since) if since is not None else None
+        limit = int(limit) if limit is not None else None
+        points = int(points) if points is not None else None
+        sensorId = int(sensorId)
+    except ValueError:
+        return {"error": "since, limit, points and sensor must be integers"}, 400
+    sensor = find_sensor(sensorId)
+    if sensor is None:
+        return {"error": "unknown sensor"}, 404
+    history = sensor.history
+    if limit is not None and limit < 0:
+        return {"error": "limit can't be negative"}, 400
+    if points is not None and points < 1:
+        return {"error": "points must be at least 1"}, 400
+    headers = {'Content-Type': 'application/json'}
+    if points is None:
+        return stream_json(history.rows(*history.find(since, limit))), 200, headers
+    tier = history.pick_tier(since, points)
+    if tier is None:
+        rows = history.rows(*history.find(since, limit), summary=True)
+    else:
+        rows = tier.rows(*tier.find(since, limit))
+    prefix = '{{"resolutionMs":{},"rows":['.format(tier.resolutionMs if tier else 0)
+    return stream_json(rows, prefix, "]}"), 200, headers
 
-# Create server-side coroutine for websocket to send temperature data to the client 
-async def send_temperature(tempSocket):
+@app.route('/sensors')
+async def get_sensors(request):
     """
-    @brief Server-side coroutine for websocket to send temperature data to the client.
+    @brief Function/Route that sends the numbers of every sensor as a JSON array
 
-    @param tempSocket The Microdot "WebSocket" object containing details about the websocket connection.
+    @param request The Microdot "Request" object containing details about a client HTTP request.
 
     @details
-    - This coroutine is asynchronous and is started when the client connects to the websocket.
-    - It sends temperature data to the client every 0.5 seconds.
+    - For each sensor: its ID, I2C address, conversion cycle, the number of readings taken since the start and of reads
+      that failed, and the timestamp and temperature of the latest reading.
     """
-    print("Spawned send_temperature coroutine")
+    return [sensor.status() for sensor in sensors]
+
+# The one coroutine that reads the TMP117s and publishes the readings to all the clients
+async def sample_temperature():
+    """
+    @brief Coroutine that owns the TMP117s, reads them, and publishes every reading to all the connected websocket clients.
+
+    @details
+    - This coroutine is asynchronous and is started once, together with the web server.
+    - It reads every conversion of every TMP117, however many clients are connected, so the I2C bus does the same work
+      for one client as for ten. The only cost of each extra client is sending it the messages.
+    - Between conversions it sleeps, so the server is free to answer requests. Each sensor converts on its own schedule,
+      and the sensor whose next conversion is due first is always the next one checked, so the reads of the sensors are
+      interleaved on the bus and none of them waits behind another that isn't ready yet. Once a conversion is due, its
+      data ready flag is checked kPollsPerCycle times per cycle, so a reading is never more than a fraction of a cycle
+      old when it is sent.
+    - Every reading is fanned out to the history and numbers of its sensor, and to the websocket clients.
+    - Readings are collected into batches of up to kBatchSize readings or kBatchWindow milliseconds, see ReadingBatch.
+    - An error while starting, reading or publishing, like an I2C error from a loose wire, is printed and counted, and
+      the sensor is left alone for a conversion cycle before it is tried again, so one bad read never stops the
+      readings of every client.
+    """
+    print("Spawned sample_temperature coroutine")
+    batch = ReadingBatch(kBatchWindow, kBatchSize)
+    # Each sensor is started the first time it is checked, so one that fails is simply tried again later
+    for sensor in sensors:
+        sensor.nextCheck = ticks_ms()
     while True:
-        if myTMP117.data_ready():
-            # We'll store all our results in a dictionary so it's easy to dump to JSON
-            data = {"tempF": 0, "tempC": 0, "limitH": 75, "limitL": 65, "alertH": False, "alertL": False} 
-            data['tempC'] = myTMP117.read_temp_c()
-            data['tempF'] = myTMP117.read_temp_f()
-
-            if kDoAlerts:
-                await asyncio.sleep(1.5) # This delay between reads to the config register is necessary. see qwiic_tmp117_ex2
-                alertFlags = myTMP117.get_high_low_alert() # Returned value is a list containing the two flags
-                data['alertL'] = bool(alertFlags[myTMP117.kLowAlertIdx])
-                data['alertH'] = bool(alertFlags[myTMP117.kHighAlertIdx])
-                data['limitL'] = c_to_f(myTMP117.get_low_limit())
-                data['limitH'] = c_to_f(myTMP117.get_high_limit())
-
-            data = json.dumps(data) # Convert to a json string to be parsed by client
-            await tempSocket.send(data)
-            await asyncio.sleep(0.5)
+        # Find the sensor whose next conversion is due first
+        sensor = sensors[0]
+        for other in sensors:
+            if ticks_diff(other.nextCheck, sensor.nextCheck) < 0:
+                sensor = other
+
+        # Sleep until its conversion is due, unless the batch has to be sent before then
+        waitMs = max(0, ticks_diff(sensor.nextCheck, ticks_ms()))
+        timeLeft = batch.time_left()
+        if timeLeft is not None and timeLeft <= waitMs:
+            await asyncio.sleep(timeLeft / 1000)
+            try:
+                await publish_readings(batch.take())
+            except Exception as exc:
+                print("Couldn't publish the readings: " + repr(exc))
+            continue
+        await asyncio.sleep(waitMs / 1000)
+
+        try:
+            if not sensor.started:
+                await sensor.start()
+                continue
+            reading = await sensor.poll()
+            if reading is not None:
+                sensor.record(*reading)
+                batch.add(reading)
+        except Exception as exc:
+            sensor.errors += 1
+            print("Couldn't read sensor " + str(sensor.sensorId) + ": " + repr(exc))
+            # Give the bus a conversion cycle to recover before trying this sensor again
+            sensor.nextCheck = ticks_add(ticks_ms(), int(sensor.cycleMs))
+
+def queue_limits(data):
+    """
+    @brief Function to check a message of new limits from a client and queue them in limitUpdater
+
+    @param data The text of the websocket message, like {"low_input": 65, "high_input": 75, "sensor": 0}.
+
+    @details
+    - Returns None if the limits were queued, or a short description of what is wrong with the message. Nothing is
+      queued unless the whole message is valid.
+    """
+    if not kDoAlerts:
+        return "limits are disabled"
+    try:
+        limitJson = json.loads(data)
+    except ValueError:
+        return "not JSON"
+    if not isinstance(limitJson, dict):
+        return "not a JSON object"
+    targets = sensors
+    if 'sensor' in limitJson:
+        sensor = find_sensor(limitJson['sensor'])
+        if sensor is None:
+            return "unknown sensor"
+        targets = [sensor]
+    updates = []
+    for key, which in (('low_input', "low"), ('high_input', "high")):
+        if key in limitJson:
+            degreesC = parse_limit(limitJson[key])
+            if degreesC is None:
+                return "invalid " + key
+            updates.append((which, degreesC))
+    if not updates:
+        return "no limits"
+    if len(updates) == 2 and updates[0][1] > updates[1][1]:
+        return "low limit above high limit"
+    for sensor in targets:
+        for which, degreesC in updates:
+            limitUpdater.request(sensor, which, degreesC)
+    return None
 
 @app.route('/temperature')
 @with_websocket
@@ -136,66 +982,68 @@ async def handle_limits(request, ws):
     @param ws The Microdot "WebSocket" object containing details about the websocket connection.
 
     @details
-    - This function is asynchronous and is called when a client requests a file from the server.
-    - The requested file is located in the "static" directory.
-    - The requested file is sent to the client.
+    - This function is asynchronous and is called when a client opens a websocket to the /temperature route.
+    - The client is subscribed to the hub for the format it asked for, so it receives every reading published by
+      sample_temperature(). The hub drops the client when the connection closes.
+    - It then waits for new limits from the client. A "sensor" field picks the sensor the limits are for, by its position
+      in kSensorAddresses. Without it, the limits are set on every sensor.
+    - New limits are checked and handed to limitUpdater, which writes them to the TMP117s and confirms them to every
+      client. A message that isn't valid is answered with {"error": "..."}, to this client only.
     """
     print("Spawned handle_limits coroutine")
     # We won't start sending data until now, when we know the client has connected to the websocket
-    # Let's start the send_temperature coroutine and pass it the websocket object
-    asyncio.create_task(send_temperature(ws))
-    while True:
+    if ws.subprotocol == kBinaryProtocol:
+        binaryHub.subscribe(ws)
+    else:
+        jsonHub.subscribe(ws)
+    try:
+        while True:
             # Lets block here until we receive a message from the client
             data = await ws.receive()
-            print("Received new limit: " + data)
-            limitJson = json.loads(data)
-            # Check if the client sent a new high or low limit, and update the TMP117 accordingly
-            if 'low_input' in limitJson:
-                toSet = f_to_c(limitJson['low_input'])
-                print("setting low limit to: " + str(toSet))
-                myTMP117.set_low_limit(toSet)
-                print("New low limit: " + str(myTMP117.get_low_limit()))
-            if 'high_input' in limitJson:
-                toSet = f_to_c(limitJson['high_input'])
-                print("setting high limit to: " + str(toSet))
-                myTMP117.set_high_limit(toSet)
-                print("New high limit: " + str(myTMP117.get_high_limit()))
-
-@app.route('/static/<path:path>')
-async def static(request, path):
-    """
-    @brief Function/Route to the static folder to serve up the HTML and CSS files
+            error = queue_limits(data)
+            if error is not None:
+                # Only the client that sent the bad message is told, the limits it asked for aren't changed
+                await ws.send(json.dumps({"error": error}), droppable=False)
+    finally:
+        # The client is gone (it closed the page, or stopped answering pings). Closing the websocket removes it from its hub
+        print("Websocket closed")
 
-    @param request The Microdot "Request" object containing details about a client HTTP request.
-    @param path The path to the requested file.
+async def serve(host="0.0.0.0", port=5000):
+    """
+    @brief Start the temperature sampler and the web server
 
-    @details
-    - This function is asynchronous and is called when a client requests a file from the server.
-    - The requested file is located in the "static" directory.
-    - The requested file is sent to the client.
+    @param host The address the server listens on. The default listens on all the network interfaces.
+    @param port The port the server listens on. Port 5000 is the default port for Microdot.
     """
-    if '..' in path:
-        # directory traversal is not allowed
-        return 'Not found', 404
-    return send_file('static/' + path)
+    asyncio.create_task(sample_temperature())
+    try:
+        await app.start_server(host=host, port=port)
+    finally:
+        sensorIO.close()
 
 def run():
     """
     @brief Configure the WLAN, and TMP117 and run the web server
     """
-    # Set up the AP
-    print("Formatting WIFI")
-    accessPointIp = wlan_ap.config_wlan_as_ap(kApSsid, kApPass)
-    print("WiFi Configured!")
+    # Set up the AP. A simulated sensor is for trying the server out on a computer that is already on a network
+    if kSimulateSensor:
+        accessPointIp = "localhost"
+    else:
+        print("Formatting WIFI")
+        accessPointIp = wlan_ap.config_wlan_as_ap(kApSsid, kApPass)
+        print("WiFi Configured!")
 
-    # Set up the TMP117
-    config_TMP117(myTMP117, kDoAlerts)
+    # Set up the TMP117s
+    for sensor in sensors:
+        config_TMP117(sensor.device, kDoAlerts)
 
     # Print the IP address of the server, port 5000 is the default port for Microdot
     print("\nNavigate to http://" + accessPointIp + ":5000/ to view the TMP117 temperature readings\n")
 
-    # Start the web server
-    app.run()
+    # Start the temperature sampler and the web server
+    asyncio.run(serve())
 
 # Finally after we've defined all our functions, we'll call the run function to start the server!
-run()
+# (The check lets the benchmarks import this file to reuse the app without starting it)
+if __name__ == "__main__":
+    run()